@@ -0,0 +1,138 @@
+"""
+Сравнение бэкендов векторизации (torch / onnx / onnx-int8) на отложенном наборе текстов.
+
+Для каждого бэкенда выводит:
+    - скорость (постов в секунду) и время загрузки модели;
+    - пиковый RSS процесса (каждый бэкенд запускается в отдельном процессе);
+    - совпадение с torch: косинус между векторами одного текста и расхождение
+      попарных оценок сходства, включая число пар, у которых меняется решение
+      "дубль / не дубль" на пороге SEMANTIC_THRESHOLD.
+
+Запуск:
+    python -m benchmarks.embedding_backends                    # тексты из таблицы posts
+    python -m benchmarks.embedding_backends --file posts.json  # тексты из JSON (список постов)
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import resource
+import time
+from typing import List
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+async def load_texts_from_db(limit: int) -> List[str]:
+    from database.db import create_db_pool
+    pool = await create_db_pool()
+    try:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT raw_text FROM posts WHERE raw_text <> '' ORDER BY random() LIMIT $1", limit
+            )
+    finally:
+        await pool.close()
+    return [row['raw_text'] for row in rows]
+
+
+def load_texts_from_file(path: str, limit: int) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    texts = [post.get("text", "").strip() if isinstance(post, dict) else str(post) for post in data]
+    return [text for text in texts if text][:limit]
+
+
+def _run_backend(backend: str, texts: List[str], batch_size: int, queue):
+    # Отдельный процесс: чистый замер памяти и времени загрузки
+    from src.text_processing.embeddings import load_model
+
+    start = time.perf_counter()
+    model = load_model(backend)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    embeddings = model.encode(texts, batch_size=batch_size, normalize_embeddings=True,
+                              convert_to_numpy=True, show_progress_bar=False)
+    encode_seconds = time.perf_counter() - start
+
+    # ru_maxrss в Linux — в килобайтах
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put({
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "posts_per_second": len(texts) / encode_seconds if encode_seconds else float("inf"),
+        "peak_rss_mb": peak_rss_mb,
+        "embeddings": np.asarray(embeddings, dtype=np.float32),
+    })
+
+
+def run_backend(backend: str, texts: List[str], batch_size: int) -> dict:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_backend, args=(backend, texts, batch_size, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def parity_report(reference: np.ndarray, candidate: np.ndarray, threshold: float) -> dict:
+    """Сравнивает векторы бэкенда с эталонными (torch)."""
+    same_text_cos = np.sum(reference * candidate, axis=1)
+    ref_scores = reference @ reference.T
+    cand_scores = candidate @ candidate.T
+    upper = np.triu_indices(len(reference), k=1)
+    score_diff = np.abs(ref_scores[upper] - cand_scores[upper])
+    flipped = np.sum((ref_scores[upper] > threshold) != (cand_scores[upper] > threshold))
+    return {
+        "same_text_cos_mean": float(same_text_cos.mean()),
+        "same_text_cos_min": float(same_text_cos.min()),
+        "pair_score_diff_mean": float(score_diff.mean()) if score_diff.size else 0.0,
+        "pair_score_diff_max": float(score_diff.max()) if score_diff.size else 0.0,
+        "pairs_above_threshold_torch": int(np.sum(ref_scores[upper] > threshold)),
+        "decisions_flipped": int(flipped),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк бэкендов векторизации")
+    parser.add_argument("--file", help="JSON со списком постов (по умолчанию — тексты из таблицы posts)")
+    parser.add_argument("--limit", type=int, default=500, help="Сколько текстов взять")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    # Значение по умолчанию совпадает с SEMANTIC_THRESHOLD в pipeline.py
+    parser.add_argument("--threshold", type=float, default=0.95)
+    args = parser.parse_args()
+
+    if args.file:
+        texts = load_texts_from_file(args.file, args.limit)
+    else:
+        texts = asyncio.run(load_texts_from_db(args.limit))
+    print(f"Текстов в наборе: {len(texts)}")
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "torch" not in backends:
+        backends.insert(0, "torch")  # torch — эталон для сравнения
+
+    results = {backend: run_backend(backend, texts, args.batch_size) for backend in backends}
+    reference = results["torch"]["embeddings"]
+
+    print(f"\n{'backend':<10} {'posts/sec':>10} {'load, s':>8} {'peak RSS, MB':>13}")
+    for backend, result in results.items():
+        print(f"{backend:<10} {result['posts_per_second']:>10.1f} {result['load_seconds']:>8.1f} {result['peak_rss_mb']:>13.0f}")
+
+    print(f"\nСовпадение с torch (порог {args.threshold}):")
+    for backend, result in results.items():
+        if backend == "torch":
+            continue
+        report = parity_report(reference, result["embeddings"], args.threshold)
+        print(f"  {backend}:")
+        for key, value in report.items():
+            print(f"    {key}: {value:.4f}" if isinstance(value, float) else f"    {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Сравнение сокращённых векторов (Matryoshka / PCA) с полноразмерными.
+
+Для каждого режима и размерности выводит:
+    - размер вектора в базе (байт);
+    - recall и precision пар-дублей на пороге SEMANTIC_THRESHOLD относительно
+      полных векторов (эталон — пары, которые полные векторы считают дублями);
+    - порог для сокращённых векторов с лучшим F1 и recall/precision на нём.
+PCA обучается на первой половине набора, качество меряется на всём наборе.
+
+Запуск:
+    python -m benchmarks.embedding_reduction                        # тексты из таблицы posts
+    python -m benchmarks.embedding_reduction --file posts.json --dims 64,128,256
+"""
+import argparse
+import asyncio
+from typing import Tuple
+import numpy as np
+from dotenv import load_dotenv
+from benchmarks.embedding_backends import load_texts_from_db, load_texts_from_file
+
+load_dotenv()
+
+
+def pair_scores(embeddings: np.ndarray) -> np.ndarray:
+    """Косинусные сходства всех пар (i < j) одним вектором."""
+    upper = np.triu_indices(len(embeddings), k=1)
+    return (embeddings @ embeddings.T)[upper]
+
+
+def recall_precision(reference: np.ndarray, predicted: np.ndarray) -> Tuple[float, float]:
+    true_positive = np.sum(reference & predicted)
+    recall = true_positive / reference.sum() if reference.sum() else 1.0
+    precision = true_positive / predicted.sum() if predicted.sum() else 1.0
+    return float(recall), float(precision)
+
+
+def best_threshold(reference: np.ndarray, scores: np.ndarray) -> Tuple[float, float, float]:
+    """Порог для сокращённых векторов с лучшим F1 против эталонных пар."""
+    best = (0.0, 0.0, 0.0, -1.0)
+    for threshold in np.arange(0.80, 0.995, 0.005):
+        recall, precision = recall_precision(reference, scores > threshold)
+        f1 = 2 * recall * precision / (recall + precision) if recall + precision else 0.0
+        if f1 > best[3]:
+            best = (float(threshold), recall, precision, f1)
+    return best[:3]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сокращения размерности векторов")
+    parser.add_argument("--file", help="JSON со списком постов (по умолчанию — тексты из таблицы posts)")
+    parser.add_argument("--limit", type=int, default=2000, help="Сколько текстов взять")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--dims", default="64,128,256,384")
+    parser.add_argument("--modes", default="matryoshka,pca")
+    # Значение по умолчанию совпадает с SEMANTIC_THRESHOLD в pipeline.py
+    parser.add_argument("--threshold", type=float, default=0.95)
+    args = parser.parse_args()
+
+    from src.text_processing.embeddings import embedding_backend, load_model
+    from src.text_processing.reduction import MatryoshkaReducer, PcaReducer
+
+    if args.file:
+        texts = load_texts_from_file(args.file, args.limit)
+    else:
+        texts = asyncio.run(load_texts_from_db(args.limit))
+    print(f"Текстов в наборе: {len(texts)}")
+
+    model = load_model(embedding_backend())
+    full = np.asarray(model.encode(texts, batch_size=args.batch_size, normalize_embeddings=True,
+                                   convert_to_numpy=True, show_progress_bar=False), dtype=np.float32)
+    full_dim = full.shape[1]
+    reference = pair_scores(full) > args.threshold
+    print(f"Полная размерность: {full_dim} ({full_dim * 4} байт), пар-дублей на пороге {args.threshold}: "
+          f"{int(reference.sum())}")
+
+    fit_set = full[:max(len(full) // 2, 1)]
+    print(f"\n{'mode':<11} {'dim':>5} {'bytes':>6} {'recall':>7} {'prec.':>7}   "
+          f"{'best thr':>8} {'recall':>7} {'prec.':>7}")
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        for dim in [int(d) for d in args.dims.split(",") if d.strip()]:
+            if dim >= full_dim:
+                continue
+            if mode == "matryoshka":
+                reducer = MatryoshkaReducer(dim)
+            elif len(fit_set) >= dim:
+                reducer = PcaReducer.fit(fit_set, dim)
+            else:
+                print(f"{mode:<11} {dim:>5}  мало текстов для PCA ({len(fit_set)} < {dim})")
+                continue
+            scores = pair_scores(reducer.apply(full))
+            recall, precision = recall_precision(reference, scores > args.threshold)
+            threshold, best_recall, best_precision = best_threshold(reference, scores)
+            print(f"{mode:<11} {dim:>5} {dim * 4:>6} {recall:>7.3f} {precision:>7.3f}   "
+                  f"{threshold:>8.3f} {best_recall:>7.3f} {best_precision:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
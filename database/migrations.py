@@ -0,0 +1,191 @@
+"""
+Миграции схемы базы данных.
+Запуск: python -m database.migrations
+"""
+import asyncio
+import os
+from loguru import logger
+from database.db import create_db_pool
+from src.text_processing.semantic_index import POST_DAY_SQL, HnswSemanticIndex, hnsw_index_path
+from src.text_processing.reduction import (
+    MatryoshkaReducer, PcaReducer, pca_path, reduced_dim, reduction_mode
+)
+from src.text_processing.vector_codec import vectors_from_bytes, vectors_to_bytes, vector_to_pgvector_text
+
+
+async def _column_type(conn, table: str, column: str):
+    return await conn.fetchval(
+        """
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = $1 AND column_name = $2
+        """,
+        table, column
+    )
+
+
+async def migrate_vectors_to_bytea(pool):
+    """
+    Переводит posts.vector_raw и posts.vector_rewritten из JSON-текста в BYTEA
+    (упакованный float32, см. src/text_processing/vector_codec.py).
+    Конвертация выполняется в SQL через float4send(), повторный запуск ничего не делает.
+    """
+    async with pool.acquire() as conn:
+        for column in ("vector_raw", "vector_rewritten"):
+            column_type = await _column_type(conn, "posts", column)
+            if column_type is None or column_type == "bytea":
+                logger.info(f"⏭ posts.{column}: миграция не требуется ({column_type})")
+                continue
+
+            logger.info(f"🔧 posts.{column}: {column_type} → bytea")
+            async with conn.transaction():
+                await conn.execute(f"ALTER TABLE posts ADD COLUMN {column}_bin BYTEA")
+                result = await conn.execute(f"""
+                    UPDATE posts SET {column}_bin = (
+                        SELECT string_agg(float4send(v::float4), ''::bytea ORDER BY ord)
+                        FROM json_array_elements_text({column}::json) WITH ORDINALITY AS t(v, ord)
+                    )
+                    WHERE {column} IS NOT NULL AND {column} <> ''
+                """)
+                await conn.execute(f"ALTER TABLE posts DROP COLUMN {column}")
+                await conn.execute(f"ALTER TABLE posts RENAME COLUMN {column}_bin TO {column}")
+            logger.success(f"✅ posts.{column} переведена в bytea ({result})")
+
+
+async def migrate_pgvector(pool, batch_size: int = 1000):
+    """
+    Готовит базу к SEMANTIC_BACKEND=pgvector: включает расширение vector,
+    добавляет колонку posts.embedding, заполняет её из posts.vector_raw
+    и строит индекс HNSW по косинусному расстоянию.
+    Требует, чтобы posts.vector_raw уже был в BYTEA (migrate_vectors_to_bytea).
+    """
+    async with pool.acquire() as conn:
+        sample = await conn.fetchval("SELECT vector_raw FROM posts WHERE vector_raw IS NOT NULL LIMIT 1")
+        if sample is None:
+            logger.warning("⚠️ В posts нет векторов — размерность для posts.embedding неизвестна")
+            return
+        dim = vectors_from_bytes([sample]).shape[1]
+
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        await conn.execute(f"ALTER TABLE posts ADD COLUMN IF NOT EXISTS embedding vector({dim})")
+
+        # Переносим векторы пачками, чтобы не держать всю историю в памяти
+        filled = 0
+        while True:
+            rows = await conn.fetch(
+                "SELECT id, vector_raw FROM posts WHERE embedding IS NULL AND vector_raw IS NOT NULL LIMIT $1",
+                batch_size
+            )
+            if not rows:
+                break
+            matrix = vectors_from_bytes([row['vector_raw'] for row in rows])
+            await conn.executemany(
+                "UPDATE posts SET embedding = $2::vector WHERE id = $1",
+                [(row['id'], vector_to_pgvector_text(vector)) for row, vector in zip(rows, matrix)]
+            )
+            filled += len(rows)
+            logger.info(f"🔧 posts.embedding: заполнено {filled} строк")
+
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS posts_embedding_hnsw_idx ON posts USING hnsw (embedding vector_cosine_ops)"
+        )
+        # Выборка постов окна свежести (SEMANTIC_WINDOW_DAYS) идёт по дате, а не по HNSW
+        await conn.execute(f"CREATE INDEX IF NOT EXISTS posts_post_day_idx ON posts (({POST_DAY_SQL}))")
+        logger.success(f"✅ posts.embedding (vector({dim})) и индекс HNSW готовы")
+
+
+async def migrate_normalized_hash(pool):
+    """
+    Добавляет posts.normalized_hash (SHA-256 канонического исходного текста VK, см.
+    src/text_processing/normalization.py) и индекс по нему.
+
+    Старые строки не заполняются: до этой колонки posts.raw_text хранил уже переписанный
+    AI текст, и хэш от него никогда не совпал бы с хэшем исходного текста нового поста.
+    У старых постов normalized_hash остаётся NULL — их дубли ловят hash, MinHash и семантика.
+    """
+    async with pool.acquire() as conn:
+        await conn.execute("ALTER TABLE posts ADD COLUMN IF NOT EXISTS normalized_hash VARCHAR")
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS posts_normalized_hash_idx ON posts (normalized_hash)"
+        )
+        logger.success("✅ posts.normalized_hash и индекс готовы")
+
+
+async def migrate_reduce_embeddings(pool, batch_size: int = 1000, pca_sample_size: int = 20000):
+    """
+    Пересчитывает сохранённые векторы (vector_raw, vector_rewritten) в сокращённую
+    размерность EMBEDDING_REDUCTION / EMBEDDING_REDUCED_DIM (см. reduction.py).
+    Для PCA при отсутствии файла проекции сначала обучает её на случайной выборке
+    полных векторов из posts и сохраняет рядом с моделью.
+    Колонка posts.embedding другой размерности удаляется — migrate_pgvector создаст её заново,
+    локальный индекс SEMANTIC_HNSW_PATH удаляется и перестроится при следующем запуске.
+    Сокращение необратимо: полные векторы можно вернуть только повторной векторизацией.
+    """
+    mode, dim = reduction_mode(), reduced_dim()
+    if mode == "none":
+        return
+    target_bytes = dim * 4
+
+    async with pool.acquire() as conn:
+        if mode == "matryoshka":
+            reducer = MatryoshkaReducer(dim)
+        else:
+            path = pca_path(dim)
+            if os.path.exists(path):
+                reducer = PcaReducer.load(path)
+            else:
+                rows = await conn.fetch(
+                    """
+                    SELECT vector_raw FROM posts
+                    WHERE octet_length(vector_raw) > $1
+                    ORDER BY random() LIMIT $2
+                    """,
+                    target_bytes, pca_sample_size
+                )
+                reducer = PcaReducer.fit(vectors_from_bytes([row['vector_raw'] for row in rows]), dim)
+                reducer.save(path)
+                logger.info(f"💾 Проекция PCA сохранена: {path}")
+
+        for column in ("vector_raw", "vector_rewritten"):
+            converted = 0
+            while True:
+                rows = await conn.fetch(
+                    f"SELECT id, {column} FROM posts WHERE octet_length({column}) > $1 ORDER BY id LIMIT $2",
+                    target_bytes, batch_size
+                )
+                if not rows:
+                    break
+                reduced = reducer.apply(vectors_from_bytes([row[column] for row in rows]))
+                await conn.executemany(
+                    f"UPDATE posts SET {column} = $2 WHERE id = $1",
+                    [(row['id'], blob) for row, blob in zip(rows, vectors_to_bytes(reduced))]
+                )
+                converted += len(rows)
+                logger.info(f"🔧 posts.{column}: сокращено до {dim} измерений {converted} строк")
+
+        # typmod колонки pgvector — её размерность
+        embedding_dim = await conn.fetchval(
+            "SELECT atttypmod FROM pg_attribute WHERE attrelid = 'posts'::regclass AND attname = 'embedding' "
+            "AND NOT attisdropped"
+        )
+        if embedding_dim is not None and embedding_dim != dim:
+            await conn.execute("ALTER TABLE posts DROP COLUMN embedding")
+            logger.info(f"🔧 posts.embedding (vector({embedding_dim})) удалена — будет создана заново")
+    if HnswSemanticIndex.remove_files(hnsw_index_path()):
+        logger.info(f"🔧 Индекс HNSW {hnsw_index_path()} удалён — будет перестроен при следующем запуске")
+    logger.success(f"✅ Векторы в posts приведены к {mode}, {dim} измерений")
+
+
+async def main():
+    pool = await create_db_pool()
+    try:
+        await migrate_vectors_to_bytea(pool)
+        await migrate_normalized_hash(pool)
+        await migrate_reduce_embeddings(pool)
+        if os.getenv("SEMANTIC_BACKEND", "memory").lower() == "pgvector":
+            await migrate_pgvector(pool)
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+Состояние парсинга VK по группам-источникам.
+Для каждой группы хранится последний увиденный пост (high-water mark),
+чтобы при следующем запуске догружать только новые посты.
+"""
+from datetime import datetime
+from typing import Dict
+from loguru import logger
+
+
+CREATE_VK_GROUP_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS vk_group_state (
+    group_name VARCHAR PRIMARY KEY,
+    last_post_id BIGINT NOT NULL,
+    last_post_date TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT NOW()
+)
+"""
+
+
+async def load_high_water_marks(pool) -> Dict[str, dict]:
+    """
+    Загружает последние увиденные посты по группам.
+
+    :param pool: asyncpg pool
+    :return: {group_name: {"post_id": int, "post_date": str}}
+    """
+    async with pool.acquire() as conn:
+        await conn.execute(CREATE_VK_GROUP_STATE_SQL)
+        rows = await conn.fetch("SELECT group_name, last_post_id, last_post_date FROM vk_group_state")
+
+    marks = {
+        row["group_name"]: {
+            "post_id": row["last_post_id"],
+            "post_date": row["last_post_date"].strftime('%Y-%m-%d %H:%M:%S') if row["last_post_date"] else None,
+        }
+        for row in rows
+    }
+    logger.info(f"📍 Загружены отметки последних постов для {len(marks)} групп")
+    return marks
+
+
+async def save_high_water_marks(pool, marks: Dict[str, dict]):
+    """
+    Сохраняет последние увиденные посты по группам.
+    Отметка никогда не сдвигается назад (GREATEST по ID поста).
+
+    :param pool: asyncpg pool
+    :param marks: {group_name: {"post_id": int, "post_date": str}}
+    """
+    if not marks:
+        return
+
+    records = []
+    for group_name, mark in marks.items():
+        post_date = mark.get("post_date")
+        try:
+            post_date = datetime.strptime(post_date, "%Y-%m-%d %H:%M:%S") if post_date else None
+        except ValueError:
+            post_date = None
+        records.append((group_name, mark["post_id"], post_date))
+
+    async with pool.acquire() as conn:
+        await conn.execute(CREATE_VK_GROUP_STATE_SQL)
+        await conn.executemany(
+            """
+            INSERT INTO vk_group_state (group_name, last_post_id, last_post_date, updated_at)
+            VALUES ($1, $2, $3, NOW())
+            ON CONFLICT (group_name) DO UPDATE SET
+                last_post_id = GREATEST(vk_group_state.last_post_id, EXCLUDED.last_post_id),
+                last_post_date = CASE
+                    WHEN EXCLUDED.last_post_id >= vk_group_state.last_post_id THEN EXCLUDED.last_post_date
+                    ELSE vk_group_state.last_post_date
+                END,
+                updated_at = NOW()
+            """,
+            records
+        )
+    logger.info(f"📍 Сохранены отметки последних постов для {len(records)} групп")
@@ -10,10 +10,13 @@ from telethon.tl.types import PeerChannel  # Для работы с канала
 from userbot.userbot_tg_functions import userbot_post_to_channel
 from src.text_processing.pipeline import process_posts
 from database.db import create_db_pool, create_db_pool_diagnostic
+from database.vk_state import load_high_water_marks, save_high_water_marks
 from src.config_channels import channel_list
 from config import credentials
 # from run import prepare_vk_post_for_tg
-from src.text_processing.pipeline import get_vk_last_posts, prepare_vk_post_for_tg
+from src.text_processing.pipeline import get_vk_last_posts, prepare_vk_post_for_tg, check_posts_schema
+from src.text_processing.embeddings import warm_up_model, shutdown_embedding_worker
+from src.text_processing.ai import deepseek, gigachat
 from loguru import logger
 from pprint import pprint
 from src.text_processing.functions import sleep_with_log
@@ -59,6 +62,15 @@ async def main(token: str):
     except RuntimeError as e:
         logger.critical(f"🚫 Не удалось установить соединение с БД: {e}")
         return
+
+    # Схема posts должна быть обновлена миграциями — иначе не сохранится ни один пост
+    try:
+        async with pool.acquire() as conn:
+            await check_posts_schema(conn)
+    except RuntimeError as e:
+        logger.critical(f"🚫 {e}")
+        await pool.close()
+        return
     
 #     # Тестируем создание пула соединения с БД
 #     pool = await create_db_pool_diagnostic(
@@ -92,18 +104,33 @@ async def main(token: str):
     
     # 1. Получаем свежие посты из VK через парсер
     print("🔄 Получаем свежие посты из VK...")
+
+    # Последние увиденные посты по группам — парсим только то, что вышло после них
+    high_water_marks = await load_high_water_marks(pool)
     
-    posts, vk_stats = get_vk_last_posts(
+    posts, vk_stats = await get_vk_last_posts(
         access_token=token,
         group_names=channel_list,
         count=count,
         save_path=None,
-        delay_between_requests=0.3
+        requests_per_second=3,
+        use_execute=True,
+        high_water_marks=high_water_marks,
     )
     
     # Выводим статистику парсинга VK
     logger.info(f"📊 VK Parsing Stats: {vk_stats['processed_groups']}/{vk_stats['total_groups']} groups, {vk_stats['total_posts']} posts, {vk_stats['reposts']} reposts")
 
+    if not posts:
+        logger.info("💤 Новых постов в VK нет, завершаем работу")
+        await pool.close()
+        return
+
+    # Посты есть — грузим модель векторизации в фоне, пока посты готовятся к обработке
+    warmup_task = None
+    if os.getenv("EMBEDDING_WARMUP", "1") == "1":
+        warmup_task = asyncio.create_task(asyncio.to_thread(warm_up_model))
+
     # pprint(posts)
 
     # # Принудительная пауза с подтверждением продолжения
@@ -153,7 +180,19 @@ async def main(token: str):
 
 
     # 2. Запускаем пайплайн обработки
+    if warmup_task:
+        try:
+            await warmup_task
+        except Exception as e:
+            logger.error(f"❌ Не удалось прогреть модель векторизации: {e}")
     stats, approved_posts = await process_posts(prepared_posts, pool)
+    shutdown_embedding_worker()  # Векторы больше не нужны — освобождаем память воркеров
+    # Переписывание закончено — закрываем пулы соединений AI-клиентов
+    await deepseek.aclose()
+    await gigachat.aclose()
+
+    # Отметки сдвигаем только после обработки, чтобы при падении посты не потерялись
+    await save_high_water_marks(pool, vk_stats["high_water_marks"])
     # logger.info(f"✅ Пайплайн обработки завершен. Статистика: {stats}")
     # 3. Выводим подробную статистику
     print("\n=== Итоговая статистика ===")
@@ -239,7 +278,8 @@ async def main(token: str):
     finally:
         await bot.disconnect()  # для telethon
     
-    # 5. Точно закрываем соединения с базой данных
+    # 5. Точно закрываем соединения с базой данных и процессы векторизации
+    shutdown_embedding_worker()
     await pool.close()
     logger.info("🔒 Соединения с базой данных закрыты.")
 
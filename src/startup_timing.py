@@ -0,0 +1,29 @@
+"""
+Замер времени тяжёлых импортов (torch, sentence_transformers, yt_dlp, клиенты AI).
+Тяжёлые модули импортируются лениво — при первом использовании, —
+а время импорта пишется в лог, чтобы было видно, во что обходится запуск.
+"""
+import importlib
+import time
+from contextlib import contextmanager
+from loguru import logger
+
+
+@contextmanager
+def log_import_time(name: str):
+    """Логирует, сколько занял импорт внутри блока with."""
+    start = time.perf_counter()
+    yield
+    logger.info(f"⏱ Импорт {name}: {time.perf_counter() - start:.2f} сек")
+
+
+def timed_import(module_name: str):
+    """
+    Импортирует модуль и логирует время первого импорта.
+    Повторные вызовы берут модуль из sys.modules и ничего не логируют.
+    """
+    import sys
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    with log_import_time(module_name):
+        return importlib.import_module(module_name)
@@ -0,0 +1,135 @@
+"""
+Пакетное AI-переписывание: несколько коротких постов в одном запросе.
+SYSTEM_PROMPT уходит один раз на пакет, число запросов и суммарное ожидание падают.
+
+Модель получает JSON-массив [{"id": 1, "text": "..."}] и должна вернуть массив
+той же формы с переписанными текстами. Ответ проверяется: элементы с неизвестным
+или повторным id, пустым текстом, а при неразборчивом ответе — весь пакет,
+переписываются обычными запросами по одному посту.
+
+Настройки:
+    AI_BATCH_MAX_POSTS=1        — сколько постов в одном запросе (1 — пакетный режим выключен);
+    AI_BATCH_TOKEN_BUDGET=3000  — примерный лимит токенов входа на пакет;
+    AI_BATCH_MAX_POST_CHARS=800 — более длинные посты всегда переписываются по одному.
+"""
+import inspect
+import json
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+from loguru import logger
+
+AI_BATCH_MAX_POSTS = int(os.getenv("AI_BATCH_MAX_POSTS", "1"))
+AI_BATCH_TOKEN_BUDGET = int(os.getenv("AI_BATCH_TOKEN_BUDGET", "3000"))
+AI_BATCH_MAX_POST_CHARS = int(os.getenv("AI_BATCH_MAX_POST_CHARS", "800"))
+
+# Лимит токенов ответа: переписанный текст примерно той же длины, плюс обвязка JSON
+MAX_RESPONSE_TOKENS = 4096
+
+BATCH_INSTRUCTIONS = """
+Тебе передан JSON-массив постов вида [{"id": 1, "text": "..."}].
+Перепиши КАЖДЫЙ пост по правилам выше, независимо от остальных.
+Ответь ТОЛЬКО JSON-массивом вида [{"id": <тот же id>, "text": "<переписанный текст>"}] —
+ровно по одному элементу на каждый пост, без пояснений и без разметки markdown.
+"""
+
+_JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def estimate_tokens(text: str) -> int:
+    # Грубая оценка для русского текста: ~3 символа на токен, плюс обвязка элемента JSON
+    return len(text) // 3 + 10
+
+
+def plan_batches(texts: Dict[int, str], max_posts: int = AI_BATCH_MAX_POSTS,
+                 token_budget: int = AI_BATCH_TOKEN_BUDGET,
+                 max_post_chars: int = AI_BATCH_MAX_POST_CHARS) -> List[List[int]]:
+    """
+    Раскладывает короткие тексты по пакетам (не больше max_posts и token_budget).
+    Пакеты из одного поста не возвращаются — такие посты выгоднее переписать обычным запросом.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, text in texts.items():
+        if len(text) > max_post_chars:
+            continue
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_posts or current_tokens + tokens > token_budget):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return [batch for batch in batches if len(batch) > 1]
+
+
+def build_batch_payload(items: List[Tuple[int, str]]) -> str:
+    return json.dumps([{"id": post_id, "text": text} for post_id, text in items], ensure_ascii=False)
+
+
+def parse_batch_response(raw: Optional[str], expected_ids: List[int]) -> Dict[int, str]:
+    """
+    Разбирает ответ модели. Возвращает {id: текст} только для прошедших проверку элементов.
+    """
+    if not raw:
+        return {}
+    text = _JSON_FENCE_RE.sub("", raw.strip())
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        logger.warning("⚠️ Пакетный ответ AI не содержит JSON-массива")
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        logger.warning(f"⚠️ Пакетный ответ AI — некорректный JSON: {e}")
+        return {}
+    if not isinstance(data, list):
+        return {}
+
+    expected = set(expected_ids)
+    result: Dict[int, str] = {}
+    duplicates = set()
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        post_id, rewritten = item.get("id"), item.get("text")
+        if isinstance(post_id, str) and post_id.isdigit():
+            post_id = int(post_id)
+        if post_id not in expected or not isinstance(rewritten, str) or not rewritten.strip():
+            continue
+        if post_id in result:
+            duplicates.add(post_id)
+            continue
+        result[post_id] = rewritten.strip()
+    # Повторный id — модель перепутала посты, доверять ни одному варианту нельзя
+    for post_id in duplicates:
+        result.pop(post_id, None)
+    if len(data) != len(expected_ids) or len(result) != len(expected_ids):
+        logger.warning(f"⚠️ Пакетный ответ AI: принято {len(result)} из {len(expected_ids)} постов")
+    return result
+
+
+def batch_provider(rewrite_func) -> Optional[Tuple[str, Callable, str]]:
+    """
+    Провайдер для пакетных запросов: (имя, функция complete, SYSTEM_PROMPT).
+    Для маршрутизатора берётся текущий самый быстрый здоровый провайдер.
+    None — провайдер не поддерживает произвольные запросы.
+    """
+    if hasattr(rewrite_func, "ranked_providers"):  # RewriteRouter
+        name = rewrite_func.ranked_providers()[0]
+        rewrite_func = rewrite_func.providers[name]
+    module = inspect.getmodule(rewrite_func)
+    complete = getattr(module, "complete", None)
+    if complete is None:
+        return None
+    name = module.__name__.rsplit(".", 1)[-1]
+    return name, complete, getattr(module, "SYSTEM_PROMPT", "") + BATCH_INSTRUCTIONS
+
+
+async def rewrite_batch(complete: Callable, system_prompt: str, items: List[Tuple[int, str]]) -> Dict[int, str]:
+    """Переписывает пакет одним запросом; возвращает {id: текст} для принятых элементов."""
+    max_tokens = min(MAX_RESPONSE_TOKENS, sum(estimate_tokens(text) for _, text in items) * 2)
+    raw = await complete(system_prompt, build_batch_payload(items), max_tokens=max_tokens)
+    return parse_batch_response(raw, [post_id for post_id, _ in items])
@@ -2,19 +2,61 @@
 Все функции для работы с DeepSeek должны быть в этом файле.
 Тут инициализируется DeepSeek и функция для переписывания текста через него.
 Возвращаем переписанный текст.
+
+Клиент асинхронный (AsyncOpenAI) и создаётся один раз при первом запросе:
+все запросы идут через общий пул keep-alive соединений с явными таймаутами.
+Без DEEPSEEK_TOKEN модуль импортируется, а ошибка возникает только при обращении к DeepSeek.
+Библиотека openai тоже импортируется только при создании клиента.
 """
+import asyncio
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
 from loguru import logger
+from src.startup_timing import timed_import
 
 # --- DeepSeek Initialization ---
 load_dotenv()
-deepseek_token = os.getenv("DEEPSEEK_TOKEN")
-if not deepseek_token:
-    raise ValueError("Не найден токен DEEPSEEK_TOKEN в .env файле")
 
-client = OpenAI(api_key=deepseek_token, base_url="https://api.deepseek.com")
+MODEL = "deepseek-chat"
+
+# Таймауты (сек): установка соединения и ожидание ответа модели
+DEEPSEEK_CONNECT_TIMEOUT = float(os.getenv("DEEPSEEK_CONNECT_TIMEOUT", "10"))
+DEEPSEEK_READ_TIMEOUT = float(os.getenv("DEEPSEEK_READ_TIMEOUT", "60"))
+# Размер пула соединений (держим с запасом к числу одновременных запросов)
+DEEPSEEK_MAX_CONNECTIONS = int(os.getenv("DEEPSEEK_MAX_CONNECTIONS", "20"))
+
+_client = None
+
+
+def get_client():
+    """Общий асинхронный клиент DeepSeek, openai.AsyncOpenAI (создаётся при первом вызове)."""
+    global _client
+    if _client is None:
+        deepseek_token = os.getenv("DEEPSEEK_TOKEN")
+        if not deepseek_token:
+            raise ValueError("Не найден токен DEEPSEEK_TOKEN в .env файле")
+        httpx = timed_import("httpx")
+        AsyncOpenAI = timed_import("openai").AsyncOpenAI
+        _client = AsyncOpenAI(
+            api_key=deepseek_token,
+            base_url="https://api.deepseek.com",
+            timeout=httpx.Timeout(DEEPSEEK_READ_TIMEOUT, connect=DEEPSEEK_CONNECT_TIMEOUT),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=DEEPSEEK_MAX_CONNECTIONS,
+                    max_keepalive_connections=DEEPSEEK_MAX_CONNECTIONS,
+                ),
+            ),
+        )
+    return _client
+
+
+async def aclose():
+    """Закрывает пул соединений клиента."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
 
 SYSTEM_PROMPT = """
 Ты — AI-редактор, эксперт по рерайтингу новостных текстов. 
@@ -26,20 +68,20 @@ SYSTEM_PROMPT = """
 5.  **Сохраняй тон**: Если исходный текст нейтральный, переписанный тоже должен быть нейтральным.
 """
 
-def rewrite_text_deepseek(text_to_rewrite: str) -> str | None:
+async def complete(system_prompt: str, user_text: str, max_tokens: int = 1024) -> str | None:
     """
-    Отправляет текст в DeepSeek для переписывания.
-    Возвращает переписанный текст или None в случае ошибки.
+    Один запрос к DeepSeek с заданным системным промптом.
+    Возвращает ответ модели или None в случае ошибки.
     """
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
+        response = await get_client().chat.completions.create(
+            model=MODEL,
             messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": text_to_rewrite},
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_text},
             ],
             temperature=1,
-            max_tokens=1024,
+            max_tokens=max_tokens,
             stream=False,
         )
         if response and response.choices:
@@ -48,11 +90,19 @@ def rewrite_text_deepseek(text_to_rewrite: str) -> str | None:
         logger.error(f"❌ Ошибка при обращении к DeepSeek: {e}")
     return None
 
+
+async def rewrite_text_deepseek(text_to_rewrite: str) -> str | None:
+    """
+    Отправляет текст в DeepSeek для переписывания.
+    Возвращает переписанный текст или None в случае ошибки.
+    """
+    return await complete(SYSTEM_PROMPT, text_to_rewrite)
+
 if __name__ == "__main__":
     # Пример теста
     test_text = "Компания 'Техно-Прорыв' объявила о выпуске нового смартфона 'Галактика-25', который оснащен инновационным голографическим дисплеем и батареей на 100 часов работы. Продажи стартуют 1 сентября по цене 999 долларов."
     print("📝 Исходный текст:\n", test_text)
-    rewritten = rewrite_text_deepseek(test_text)
+    rewritten = asyncio.run(rewrite_text_deepseek(test_text))
     if rewritten:
         print("\n✅ Переписанный текст (DeepSeek):\n", rewritten)
     else:
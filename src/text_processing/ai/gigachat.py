@@ -2,23 +2,54 @@
 Все функции для работы с GigaChat должны быть в этом файле.
 Тут инициализируется GigaChat и функция для переписывания текста через него.
 Возвращаем переписанный текст.
+
+Запросы идут через асинхронный API клиента (achat) — без пула потоков.
+Клиент создаётся один раз при первом запросе и переиспользует соединения.
+Без GIGA_CHAT_TOKEN модуль импортируется, а ошибка возникает только при обращении к GigaChat.
+Библиотека gigachat тоже импортируется только при первом запросе.
 """
 import os
-import asyncio
 from dotenv import load_dotenv
-from gigachat import GigaChat
 from loguru import logger
+from src.startup_timing import timed_import
 
 # --- GigaChat Initialization ---
 load_dotenv()
-giga_chat_token = os.getenv("GIGA_CHAT_TOKEN")
-if not giga_chat_token:
-    raise ValueError("Не найден токен GIGA_CHAT_TOKEN в .env файле")
 
-giga = GigaChat(
-    credentials=giga_chat_token,
-    verify_ssl_certs=False,
-)
+MODEL = os.getenv("GIGACHAT_MODEL", "GigaChat")
+
+# Таймаут запроса (сек); клиент GigaChat принимает одно значение на соединение и ответ
+GIGACHAT_TIMEOUT = float(os.getenv("GIGACHAT_TIMEOUT", "60"))
+# Размер пула соединений
+GIGACHAT_MAX_CONNECTIONS = int(os.getenv("GIGACHAT_MAX_CONNECTIONS", "20"))
+
+_giga = None
+
+
+def get_client():
+    """Общий клиент GigaChat (создаётся при первом вызове)."""
+    global _giga
+    if _giga is None:
+        giga_chat_token = os.getenv("GIGA_CHAT_TOKEN")
+        if not giga_chat_token:
+            raise ValueError("Не найден токен GIGA_CHAT_TOKEN в .env файле")
+        GigaChat = timed_import("gigachat").GigaChat
+        _giga = GigaChat(
+            credentials=giga_chat_token,
+            model=MODEL,
+            verify_ssl_certs=False,
+            timeout=GIGACHAT_TIMEOUT,
+            max_connections=GIGACHAT_MAX_CONNECTIONS,
+        )
+    return _giga
+
+
+async def aclose():
+    """Закрывает соединения клиента."""
+    global _giga
+    if _giga is not None:
+        await _giga.aclose()
+        _giga = None
 
 SYSTEM_PROMPT = """
 Ты — AI-редактор, эксперт по рерайтингу новостных текстов. 
@@ -30,20 +61,27 @@ SYSTEM_PROMPT = """
 5.  **Сохраняй тон**: Если исходный текст нейтральный, переписанный тоже должен быть нейтральным.
 """
 
-async def rewrite_text_giga(text_to_rewrite: str) -> str | None:
+async def complete(system_prompt: str, user_text: str, max_tokens: int = None) -> str | None:
     """
-    Отправляет текст в GigaChat для переписывания.
-    Возвращает переписанный текст или None в случае ошибки.
+    Один запрос к GigaChat: системный промпт и текст отправляются одним сообщением.
+    Возвращает ответ модели или None в случае ошибки.
     """
-    payload = f"{SYSTEM_PROMPT}\n\nПерепиши следующий текст:\n\n{text_to_rewrite}"
+    payload = f"{system_prompt}\n\n{user_text}"
+    if max_tokens:
+        from gigachat.models import Chat, Messages, MessagesRole
+        payload = Chat(messages=[Messages(role=MessagesRole.USER, content=payload)], model=MODEL, max_tokens=max_tokens)
     try:
-        loop = asyncio.get_running_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: giga.chat(payload)
-        )
+        response = await get_client().achat(payload)
         if response and response.choices:
             return response.choices[0].message.content.strip()
     except Exception as e:
         logger.error(f"❌ Ошибка при обращении к GigaChat: {e}")
-    return None 
\ No newline at end of file
+    return None
+
+
+async def rewrite_text_giga(text_to_rewrite: str) -> str | None:
+    """
+    Отправляет текст в GigaChat для переписывания.
+    Возвращает переписанный текст или None в случае ошибки.
+    """
+    return await complete(SYSTEM_PROMPT, f"Перепиши следующий текст:\n\n{text_to_rewrite}")
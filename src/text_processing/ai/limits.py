@@ -0,0 +1,62 @@
+"""
+Ограничения запросов к AI-провайдерам.
+Для каждого провайдера — семафор (сколько запросов одновременно)
+и token bucket (сколько запросов в минуту).
+
+Настройки (общие и для конкретного провайдера, имя модуля в верхнем регистре):
+    AI_MAX_CONCURRENCY=4,  GIGACHAT_MAX_CONCURRENCY, DEEPSEEK_MAX_CONCURRENCY
+    AI_REQUESTS_PER_MINUTE=30,  GIGACHAT_REQUESTS_PER_MINUTE, DEEPSEEK_REQUESTS_PER_MINUTE
+"""
+import asyncio
+import os
+from typing import Dict
+from loguru import logger
+from src.vk_fetcher import TokenBucket
+
+
+def _provider_setting(provider: str, name: str, default: str) -> float:
+    return float(os.getenv(f"{provider.upper()}_{name}") or os.getenv(f"AI_{name}") or default)
+
+
+class ProviderLimiter:
+    """Семафор + лимит запросов в минуту; используется как async with limiter: ..."""
+
+    def __init__(self, provider: str, max_concurrency: int, requests_per_minute: float):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Всплеск не больше числа одновременных запросов, дальше — ровно rpm / 60 в секунду
+        self._bucket = TokenBucket(rate=requests_per_minute / 60, capacity=max_concurrency)
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        try:
+            await self._bucket.acquire()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+
+
+def provider_name(rewrite_func) -> str:
+    """Имя провайдера по модулю функции переписывания: gigachat / deepseek."""
+    return getattr(rewrite_func, "__module__", "ai").rsplit(".", 1)[-1]
+
+
+def get_provider_limiter(provider: str) -> ProviderLimiter:
+    """Общий ограничитель провайдера (создаётся при первом обращении)."""
+    if provider not in _limiters:
+        max_concurrency = max(1, int(_provider_setting(provider, "MAX_CONCURRENCY", "4")))
+        requests_per_minute = _provider_setting(provider, "REQUESTS_PER_MINUTE", "30")
+        _limiters[provider] = ProviderLimiter(provider, max_concurrency, requests_per_minute)
+        logger.info(
+            f"🚦 Лимиты {provider}: до {max_concurrency} запросов одновременно, {requests_per_minute:g} в минуту"
+        )
+    return _limiters[provider]
@@ -0,0 +1,125 @@
+"""
+Кэш результатов AI-переписывания в PostgreSQL (таблица rewrite_cache).
+Повторный запуск после сбоя публикации или повторная обработка поста
+не платят за запрос к AI второй раз.
+
+Ключ — SHA-256 от нормализованного исходного текста, SYSTEM_PROMPT и провайдера/модели:
+смена промпта или модели автоматически делает старые записи недоступными.
+Записи старше AI_REWRITE_CACHE_TTL_DAYS не используются и удаляются,
+таблица ограничена AI_REWRITE_CACHE_MAX_ROWS строками (вытесняются давно не использованные).
+"""
+import hashlib
+import inspect
+import os
+from typing import Dict, List, Tuple
+from loguru import logger
+from src.text_processing.embedding_cache import normalize_for_cache
+
+
+CREATE_REWRITE_CACHE_SQL = """
+CREATE TABLE IF NOT EXISTS rewrite_cache (
+    key VARCHAR PRIMARY KEY,
+    provider VARCHAR NOT NULL,
+    rewritten_text TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    last_used_at TIMESTAMP DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS rewrite_cache_last_used_at_idx ON rewrite_cache (last_used_at);
+"""
+
+
+def provider_fingerprint(rewrite_func) -> str:
+    """Провайдер, модель и SYSTEM_PROMPT модуля функции переписывания."""
+    if hasattr(rewrite_func, "fingerprint"):  # RewriteRouter: отпечатки всех его провайдеров
+        return rewrite_func.fingerprint
+    module = inspect.getmodule(rewrite_func)
+    provider = getattr(module, "__name__", "ai").rsplit(".", 1)[-1]
+    model = getattr(module, "MODEL", "")
+    prompt = getattr(module, "SYSTEM_PROMPT", "")
+    return f"{provider}\0{model}\0{prompt}"
+
+
+def rewrite_cache_key(text: str, fingerprint: str) -> str:
+    payload = f"{fingerprint}\0{normalize_for_cache(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RewriteCache:
+    """Кэш переписанных текстов поверх пула asyncpg."""
+
+    def __init__(self, pool, ttl_days: int = None, max_rows: int = None):
+        self.pool = pool
+        self.ttl_days = ttl_days if ttl_days is not None else int(os.getenv("AI_REWRITE_CACHE_TTL_DAYS", "30"))
+        self.max_rows = max_rows if max_rows is not None else int(os.getenv("AI_REWRITE_CACHE_MAX_ROWS", "20000"))
+        self.hits = 0
+        self.misses = 0
+        self._table_ready = False
+
+    async def _ensure_table(self, conn):
+        if not self._table_ready:
+            await conn.execute(CREATE_REWRITE_CACHE_SQL)
+            self._table_ready = True
+
+    async def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """Возвращает {ключ: переписанный текст} для найденных свежих записей."""
+        if not keys:
+            return {}
+        async with self.pool.acquire() as conn:
+            await self._ensure_table(conn)
+            rows = await conn.fetch(
+                """
+                UPDATE rewrite_cache SET last_used_at = NOW()
+                WHERE key = ANY($1::text[])
+                  AND ($2::int <= 0 OR created_at >= NOW() - make_interval(days => $2::int))
+                RETURNING key, rewritten_text
+                """,
+                list(set(keys)), self.ttl_days
+            )
+        found = {row['key']: row['rewritten_text'] for row in rows}
+        hits = sum(1 for key in keys if key in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    async def put_many(self, items: List[Tuple[str, str, str]]):
+        """
+        Сохраняет переписанные тексты и подрезает таблицу по TTL и размеру.
+
+        Args:
+            items: Список (ключ, провайдер, переписанный текст)
+        """
+        if not items:
+            return
+        async with self.pool.acquire() as conn:
+            await self._ensure_table(conn)
+            await conn.executemany(
+                """
+                INSERT INTO rewrite_cache (key, provider, rewritten_text) VALUES ($1, $2, $3)
+                ON CONFLICT (key) DO UPDATE SET
+                    rewritten_text = EXCLUDED.rewritten_text, created_at = NOW(), last_used_at = NOW()
+                """,
+                items
+            )
+            if self.ttl_days > 0:
+                await conn.execute(
+                    "DELETE FROM rewrite_cache WHERE created_at < NOW() - make_interval(days => $1::int)",
+                    self.ttl_days
+                )
+            if self.max_rows > 0:
+                await conn.execute(
+                    """
+                    DELETE FROM rewrite_cache WHERE key IN (
+                        SELECT key FROM rewrite_cache ORDER BY last_used_at DESC OFFSET $1
+                    )
+                    """,
+                    self.max_rows
+                )
+        logger.info(f"💾 В кэш переписываний добавлено {len(items)} текстов")
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "rewrite_cache_hits": self.hits,
+            "rewrite_cache_misses": self.misses,
+            "rewrite_cache_hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
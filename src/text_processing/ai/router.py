@@ -0,0 +1,244 @@
+"""
+Маршрутизация AI-переписывания между несколькими провайдерами (AI_PROVIDER=auto).
+
+Для каждого провайдера ведётся скользящее окно последних запросов (задержка, успех)
+и накопительная гистограмма задержек. Каждый текст отправляется самому быстрому
+из здоровых провайдеров (доля ошибок в окне ниже AI_MAX_ERROR_RATE). Если ответа нет
+к сроку — p95 задержки этого провайдера, считая от момента, когда запрос прошёл лимитер
+провайдера, — тот же текст отправляется следующему провайдеру (hedged request);
+берётся первый успешный ответ, второй запрос отменяется.
+Ошибка первого провайдера сразу передаёт запрос следующему.
+
+Гистограммы попадают в статистику process_posts, а при заданном AI_METRICS_PATH
+записываются в файл в текстовом формате Prometheus.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+from loguru import logger
+from src.text_processing.ai.limits import get_provider_limiter
+
+# Границы корзин гистограммы задержек, сек
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60)
+
+AI_HEDGE_DEFAULT_DEADLINE = float(os.getenv("AI_HEDGE_DEFAULT_DEADLINE", "20"))
+AI_HEDGE_MIN_DEADLINE = float(os.getenv("AI_HEDGE_MIN_DEADLINE", "2"))
+AI_MAX_ERROR_RATE = float(os.getenv("AI_MAX_ERROR_RATE", "0.5"))
+
+# Сколько последних запросов учитывать и сколько нужно, чтобы доверять оценкам
+WINDOW_SIZE = 50
+MIN_SAMPLES = 5
+
+
+class ProviderStats:
+    """Скользящее окно запросов к провайдеру и накопительная гистограмма задержек."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.window: deque = deque(maxlen=WINDOW_SIZE)  # (задержка, успех)
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+
+    def record(self, latency: float, ok: bool):
+        self.window.append((latency, ok))
+        self.requests += 1
+        self.errors += 0 if ok else 1
+        self.latency_sum += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.bucket_counts[i] += 1
+                break
+        else:
+            self.bucket_counts[-1] += 1
+
+    def error_rate(self) -> float:
+        if not self.window:
+            return 0.0
+        return sum(1 for _, ok in self.window if not ok) / len(self.window)
+
+    def latency_quantile(self, q: float) -> Optional[float]:
+        """Квантиль задержки успешных запросов в окне (None, пока данных мало)."""
+        latencies = sorted(latency for latency, ok in self.window if ok)
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def is_healthy(self) -> bool:
+        return len(self.window) < MIN_SAMPLES or self.error_rate() < AI_MAX_ERROR_RATE
+
+    def histogram(self) -> Dict[str, int]:
+        labels = [f"<={bound}s" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+        return dict(zip(labels, self.bucket_counts))
+
+
+class RewriteRouter:
+    """
+    Функция переписывания поверх нескольких провайдеров: await router(text).
+    await router.rewrite(text) дополнительно возвращает имя ответившего провайдера.
+
+    Args:
+        providers: {имя провайдера: async-функция переписывания}
+    """
+
+    def __init__(self, providers: Dict[str, Callable]):
+        if not providers:
+            raise ValueError("Для маршрутизации нужен хотя бы один AI-провайдер")
+        self.providers = providers
+        self.stats = {name: ProviderStats(name) for name in providers}
+
+    @property
+    def fingerprint(self) -> str:
+        # Ключ кэша переписываний: набор провайдеров, их модели и промпты
+        from src.text_processing.ai.rewrite_cache import provider_fingerprint
+        return "\0".join(provider_fingerprint(func) for func in self.providers.values())
+
+    def ranked_providers(self) -> List[str]:
+        """Провайдеры в порядке выбора: здоровые по медиане задержки, затем остальные по доле ошибок."""
+        def median(name):
+            value = self.stats[name].latency_quantile(0.5)
+            return value if value is not None else 0.0  # Без данных — пробуем в первую очередь
+        healthy = sorted((n for n in self.providers if self.stats[n].is_healthy()), key=median)
+        unhealthy = sorted((n for n in self.providers if not self.stats[n].is_healthy()),
+                           key=lambda n: self.stats[n].error_rate())
+        return healthy + unhealthy
+
+    def hedge_deadline(self, name: str) -> float:
+        p95 = self.stats[name].latency_quantile(0.95)
+        if p95 is None:
+            return AI_HEDGE_DEFAULT_DEADLINE
+        return max(AI_HEDGE_MIN_DEADLINE, p95)
+
+    async def _call(self, name: str, text: str, admitted: Optional[asyncio.Event] = None) -> Optional[str]:
+        async with get_provider_limiter(name):
+            # Срок для дублирования отсчитывается от этого момента, а не от постановки в очередь
+            if admitted is not None:
+                admitted.set()
+            # Задержку считаем без ожидания в лимитере — это скорость самого провайдера
+            start = time.perf_counter()
+            try:
+                result = await self.providers[name](text)
+            except asyncio.CancelledError:
+                raise  # Отменённый (проигравший) запрос в статистику не попадает
+            except Exception:
+                self.stats[name].record(time.perf_counter() - start, False)
+                raise
+        self.stats[name].record(time.perf_counter() - start, bool(result and result.strip()))
+        return result
+
+    async def __call__(self, text: str) -> Optional[str]:
+        result, _ = await self.rewrite(text)
+        return result
+
+    async def rewrite(self, text: str) -> Tuple[Optional[str], Optional[str]]:
+        """Переписывает текст; возвращает (результат, имя ответившего провайдера) или (None, None)."""
+        loop = asyncio.get_running_loop()
+        order = self.ranked_providers()
+        pending: Dict[asyncio.Task, str] = {}
+        next_index = 0
+        # Последний запущенный запрос: когда лимитер его пропустил и сколько ждать до дублирования.
+        # Ожидание в очереди своего же лимитера медленным ответом провайдера не считается.
+        admitted: Optional[asyncio.Event] = None
+        hedge_at: Optional[float] = None
+        deadline = 0.0
+
+        def launch() -> str:
+            nonlocal next_index, admitted, hedge_at, deadline
+            name = order[next_index]
+            next_index += 1
+            admitted = asyncio.Event()
+            hedge_at = None
+            deadline = self.hedge_deadline(name)
+            pending[asyncio.create_task(self._call(name, text, admitted))] = name
+            return name
+
+        launch()
+        waiter = None
+        try:
+            while pending:
+                if admitted is not None and hedge_at is None and admitted.is_set():
+                    hedge_at = loop.time() + deadline
+                if admitted is not None and hedge_at is None:
+                    # Запрос ещё в очереди лимитера — ждём допуска или ответа без срока
+                    waiter = asyncio.create_task(admitted.wait())
+                    done, _ = await asyncio.wait([*pending, waiter], return_when=asyncio.FIRST_COMPLETED)
+                    waiter.cancel()
+                    done.discard(waiter)
+                    waiter = None
+                    if not done:
+                        continue
+                else:
+                    timeout = None if hedge_at is None else max(0.0, hedge_at - loop.time())
+                    done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Нет ответа к сроку — дублируем запрос следующему провайдеру
+                    if next_index < len(order):
+                        waiting, waited = ", ".join(pending.values()), deadline
+                        name = launch()
+                        logger.info(f"⏳ {waiting}: нет ответа за {waited:.1f} сек — дублируем запрос в {name}")
+                        self.stats[name].hedges += 1
+                    else:
+                        admitted, hedge_at = None, None  # Дублировать больше некому — ждём без срока
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception():
+                        logger.error(f"❌ Ошибка AI-провайдера {name}: {task.exception()}")
+                        continue
+                    result = task.result()
+                    if result and result.strip():
+                        return result, name
+                # Провайдер ответил ошибкой — сразу пробуем следующего, если ещё не пробовали
+                if not pending and next_index < len(order):
+                    launch()
+            return None, None
+        finally:
+            if waiter is not None:
+                waiter.cancel()
+            for task in pending:
+                task.cancel()
+
+    def export_stats(self) -> Dict[str, object]:
+        """Гистограммы задержек и счётчики по провайдерам для статистики process_posts."""
+        stats = {}
+        for name, provider in self.stats.items():
+            stats[f"ai_{name}_requests"] = provider.requests
+            stats[f"ai_{name}_errors"] = provider.errors
+            stats[f"ai_{name}_hedges"] = provider.hedges
+            stats[f"ai_{name}_latency_histogram"] = provider.histogram()
+        return stats
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP ai_rewrite_latency_seconds AI rewrite request latency",
+            "# TYPE ai_rewrite_latency_seconds histogram",
+        ]
+        for name, provider in self.stats.items():
+            cumulative = 0
+            for bound, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], provider.bucket_counts):
+                cumulative += count
+                lines.append(f'ai_rewrite_latency_seconds_bucket{{provider="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'ai_rewrite_latency_seconds_sum{{provider="{name}"}} {provider.latency_sum:.3f}')
+            lines.append(f'ai_rewrite_latency_seconds_count{{provider="{name}"}} {provider.requests}')
+        lines.append("# TYPE ai_rewrite_errors_total counter")
+        for name, provider in self.stats.items():
+            lines.append(f'ai_rewrite_errors_total{{provider="{name}"}} {provider.errors}')
+        lines.append("# TYPE ai_rewrite_hedges_total counter")
+        for name, provider in self.stats.items():
+            lines.append(f'ai_rewrite_hedges_total{{provider="{name}"}} {provider.hedges}')
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self, path: Optional[str] = None):
+        """Записывает гистограммы в AI_METRICS_PATH (если задан) в формате Prometheus."""
+        path = path or os.getenv("AI_METRICS_PATH")
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        logger.info(f"📈 Метрики AI-провайдеров записаны в {path}")
@@ -0,0 +1,76 @@
+"""
+Группировка семантических дублей внутри одного запуска.
+Сходство считается одним умножением нормализованных матриц (блоками для больших батчей),
+пары выше порога объединяются в компоненты связности через union-find.
+"""
+from typing import List, Optional, Sequence
+import numpy as np
+
+
+class UnionFind:
+    """Система непересекающихся множеств со сжатием путей."""
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # Корнем остаётся меньший индекс — группы сохраняют порядок постов
+            if root_b < root_a:
+                root_a, root_b = root_b, root_a
+            self.parent[root_b] = root_a
+
+
+def find_duplicate_groups(
+    embeddings: np.ndarray,
+    threshold: float,
+    urls: Optional[Sequence[Optional[str]]] = None,
+    block_size: int = 1024,
+) -> List[List[int]]:
+    """
+    Находит группы семантических дублей.
+
+    Args:
+        embeddings: Матрица векторов (n, dim)
+        threshold: Порог косинусного сходства (пара — дубль, если сходство строго больше)
+        urls: URL постов — пары с одинаковым URL не считаются дублями (это один и тот же пост)
+        block_size: Сколько строк матрицы сходства считать за раз (ограничивает память)
+
+    Returns:
+        Список групп (индексы строк по возрастанию) для всех постов, включая одиночные,
+        в порядке первого поста группы
+    """
+    n = len(embeddings)
+    if n == 0:
+        return []
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = (embeddings / np.maximum(norms, 1e-12)).astype(np.float32, copy=False)
+
+    uf = UnionFind(n)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        similarities = normalized[start:stop] @ normalized.T
+        rows, cols = np.nonzero(similarities > threshold)
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            i = start + row
+            # Каждую пару берём один раз (i < col), диагональ пропускаем
+            if col <= i:
+                continue
+            if urls is not None and urls[i] is not None and urls[i] == urls[col]:
+                continue
+            uf.union(i, col)
+
+    groups = {}
+    for i in range(n):
+        groups.setdefault(uf.find(i), []).append(i)
+    return list(groups.values())
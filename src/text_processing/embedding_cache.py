@@ -0,0 +1,208 @@
+"""
+Кэш векторов текстов: перед моделью в embeddings.encode_texts.
+Ключ — SHA-256 от нормализованного текста и идентификатора модели.
+Два уровня:
+    1. LRU в памяти с ограничением по байтам;
+    2. файл на диске (memory-mapped), переживает перезапуски; размер ограничен,
+       при превышении файл уплотняется до самых свежих записей.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from loguru import logger
+
+# Ключ — 64 hex-символа + перевод строки
+_KEY_LINE_SIZE = 65
+
+# Примерные накладные расходы на одну запись LRU сверх самого вектора
+_ENTRY_OVERHEAD_BYTES = 200
+
+# Какую долю лимита диска оставлять после уплотнения — чтобы не уплотнять на каждой записи
+_DISK_COMPACT_RATIO = 0.5
+
+
+def normalize_for_cache(text: str) -> str:
+    """Схлопывает пробельные символы — на вектор они не влияют."""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """
+    Кэш векторов с LRU в памяти и постоянным уровнем на диске.
+
+    Диск: файл {dir}/{model}.vec — подряд записанные векторы float32,
+    файл {dir}/{model}.keys — ключи в том же порядке (номер строки = номер вектора).
+    Оба файла только дописываются, поэтому оборванная запись теряет максимум хвост.
+    Когда они вместе превышают max_disk_bytes, файлы переписываются заново
+    с самыми свежими записями (см. _compact_disk).
+    """
+
+    def __init__(self, model_id: str, dim: int, cache_dir: Optional[str] = None,
+                 max_memory_bytes: int = 64 * 1024 * 1024,
+                 max_disk_bytes: Optional[int] = 512 * 1024 * 1024):
+        self.model_id = model_id
+        self.dim = dim
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._disk_slots: Dict[str, int] = {}
+        self._disk_count = 0
+        self._mmap: Optional[np.memmap] = None
+        self._vec_path = self._keys_path = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            base = hashlib.sha256(f"{model_id}:{dim}".encode("utf-8")).hexdigest()[:16]
+            self._vec_path = os.path.join(cache_dir, f"{base}.vec")
+            self._keys_path = os.path.join(cache_dir, f"{base}.keys")
+            self._load_disk_index()
+
+    def key(self, text: str) -> str:
+        payload = f"{self.model_id}\0{normalize_for_cache(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # --- Диск ---
+
+    def _load_disk_index(self):
+        if not os.path.exists(self._keys_path) or not os.path.exists(self._vec_path):
+            return
+        record_size = self.dim * 4
+        vectors_on_disk = os.path.getsize(self._vec_path) // record_size
+        with open(self._keys_path, "rb") as f:
+            keys = [line.strip().decode("ascii", errors="replace") for line in f]
+        # Файлы могли оборваться на разной записи — верим только общей части
+        count = min(len(keys), vectors_on_disk)
+        self._disk_slots = {key: slot for slot, key in enumerate(keys[:count]) if len(key) == 64}
+        self._disk_count = count
+        if count != len(keys) or count != vectors_on_disk:
+            self._truncate_disk(count)
+        logger.info(f"🗄 Кэш векторов на диске: {count} записей ({self._vec_path})")
+
+    def _disk_record_size(self) -> int:
+        return self.dim * 4 + _KEY_LINE_SIZE
+
+    def _truncate_disk(self, count: int):
+        with open(self._vec_path, "r+b") as f:
+            f.truncate(count * self.dim * 4)
+        with open(self._keys_path, "r+b") as f:
+            f.truncate(count * _KEY_LINE_SIZE)
+
+    def _disk_get(self, key: str) -> Optional[np.ndarray]:
+        slot = self._disk_slots.get(key)
+        if slot is None:
+            return None
+        if self._mmap is None or slot >= self._mmap.shape[0]:
+            # Файл вырос после последнего отображения — отображаем заново
+            self._mmap = np.memmap(self._vec_path, dtype=np.float32, mode="r",
+                                   shape=(self._disk_count, self.dim))
+        return np.array(self._mmap[slot])
+
+    def _disk_put_many(self, items: List[Tuple[str, np.ndarray]]):
+        if self._vec_path is None:
+            return
+        new_items = []
+        pending = set()
+        for key, vector in items:
+            if key not in self._disk_slots and key not in pending:
+                pending.add(key)
+                new_items.append((key, vector))
+        if not new_items:
+            return
+        with open(self._vec_path, "ab") as vec_file, open(self._keys_path, "ab") as keys_file:
+            vec_file.write(np.asarray([vector for _, vector in new_items], dtype=np.float32).tobytes())
+            keys_file.write("".join(f"{key}\n" for key, _ in new_items).encode("ascii"))
+        for key, _ in new_items:
+            self._disk_slots[key] = self._disk_count
+            self._disk_count += 1
+        if self.max_disk_bytes and self._disk_count * self._disk_record_size() > self.max_disk_bytes:
+            self._compact_disk()
+
+    def _compact_disk(self):
+        """
+        Оставляет на диске самые свежие записи, занимающие не больше
+        _DISK_COMPACT_RATIO от лимита, и переписывает файлы через временные.
+
+        Сначала ключи подменяются пустым файлом: если процесс упадёт посреди
+        замены, при загрузке кэш окажется пустым, но ключи не разойдутся с векторами.
+        """
+        limit = int(self.max_disk_bytes * _DISK_COMPACT_RATIO) // self._disk_record_size()
+        kept = sorted(self._disk_slots.items(), key=lambda item: item[1])[-limit:] if limit else []
+        keys = [key for key, _ in kept]
+        vectors = np.memmap(self._vec_path, dtype=np.float32, mode="r", shape=(self._disk_count, self.dim))
+        vec_tmp, keys_tmp = f"{self._vec_path}.tmp", f"{self._keys_path}.tmp"
+        with open(vec_tmp, "wb") as f:
+            f.write(np.asarray(vectors[[slot for _, slot in kept]], dtype=np.float32).tobytes())
+        with open(keys_tmp, "wb") as f:
+            f.write("".join(f"{key}\n" for key in keys).encode("ascii"))
+        del vectors
+        self._mmap = None
+
+        open(f"{self._keys_path}.empty", "wb").close()
+        os.replace(f"{self._keys_path}.empty", self._keys_path)
+        os.replace(vec_tmp, self._vec_path)
+        os.replace(keys_tmp, self._keys_path)
+
+        logger.info(f"🗄 Кэш векторов на диске уплотнён: оставлено {len(keys)} записей из {self._disk_count}")
+        self._disk_slots = {key: slot for slot, key in enumerate(keys)}
+        self._disk_count = len(keys)
+
+    # --- Память ---
+
+    def _memory_put(self, key: str, vector: np.ndarray):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes + _ENTRY_OVERHEAD_BYTES
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes + _ENTRY_OVERHEAD_BYTES
+
+    # --- Публичный интерфейс ---
+
+    def get_many(self, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """
+        Ищет векторы для текстов.
+
+        Returns:
+            tuple: ({индекс текста: вектор} для найденных, индексы ненайденных текстов)
+        """
+        found = {}
+        missing = []
+        for i, text in enumerate(texts):
+            key = self.key(text)
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                found[i] = vector
+                continue
+            vector = self._disk_get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self._memory_put(key, vector)
+                found[i] = vector
+                continue
+            self.misses += 1
+            missing.append(i)
+        return found, missing
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        items = [(self.key(text), np.asarray(vector, dtype=np.float32)) for text, vector in zip(texts, vectors)]
+        for key, vector in items:
+            self._memory_put(key, vector)
+        self._disk_put_many(items)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "embedding_cache_hits": self.memory_hits + self.disk_hits,
+            "embedding_cache_disk_hits": self.disk_hits,
+            "embedding_cache_misses": self.misses,
+        }
@@ -0,0 +1,96 @@
+"""
+Векторизация в отдельных процессах.
+Модель живёт в процессах-воркерах, поэтому прямой проход не блокирует event loop,
+в котором крутятся asyncpg и Telethon.
+
+Тексты одного запроса делятся на части между процессами, и они считают их
+параллельно — большой батч запуска не ждёт единственного воркера.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Set
+import numpy as np
+from loguru import logger
+
+
+def _init_worker():
+    # Выполняется в процессе-воркере: модель загружается один раз на процесс
+    from src.text_processing.embeddings import get_model
+    get_model()
+
+
+def _encode_in_worker(texts: List[str], batch_size: int) -> np.ndarray:
+    from src.text_processing.embeddings import _encode_with_model
+    return _encode_with_model(texts, batch_size)
+
+
+def _model_dimension() -> int:
+    from src.text_processing.embeddings import get_model
+    return get_model().get_sentence_embedding_dimension()
+
+
+class EmbeddingWorker:
+    """
+    Пул процессов векторизации с асинхронным интерфейсом.
+
+    Args:
+        workers: Число процессов-воркеров
+        batch_size: Размер пачки для одного прохода модели внутри воркера
+        max_shard_size: Сколько текстов максимум отдавать одному процессу за раз
+    """
+
+    def __init__(self, workers: int = 1, batch_size: int = 32, max_shard_size: int = 128):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_shard_size = max_shard_size
+        # spawn: fork процесса с уже загруженным torch ненадёжен
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        self._pending: Set[asyncio.Future] = set()
+        self._dimension: Optional[int] = None
+        logger.info(f"🧵 Запущено процессов векторизации: {workers}")
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        """Возвращает матрицу векторов (len(texts), dim) в порядке texts."""
+        # Части считаются разными процессами одновременно, результат склеивается в исходном порядке
+        return np.vstack(await asyncio.gather(*(self._encode_shard(shard) for shard in self._shards(texts))))
+
+    async def dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = await self._track(
+                asyncio.get_running_loop().run_in_executor(self._executor, _model_dimension)
+            )
+        return self._dimension
+
+    def _shards(self, texts: List[str]) -> List[List[str]]:
+        """
+        Делит тексты между воркерами: по части на процесс, но не меньше одной пачки
+        модели (batch_size) и не больше max_shard_size текстов.
+        """
+        per_worker = -(-len(texts) // max(self.workers, 1))
+        size = min(self.max_shard_size, max(self.batch_size, per_worker))
+        return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+    async def _encode_shard(self, texts: List[str]) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        return await self._track(loop.run_in_executor(self._executor, _encode_in_worker, texts, self.batch_size))
+
+    async def _track(self, future: asyncio.Future):
+        # Незавершённые запросы запоминаем, чтобы close() мог их завершить с ошибкой
+        self._pending.add(future)
+        try:
+            return await future
+        finally:
+            self._pending.discard(future)
+
+    def close(self):
+        error = RuntimeError("Пул процессов векторизации остановлен")
+        for future in list(self._pending):
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,246 @@
+"""
+Векторизация текстов через sentence-transformer.
+Модель загружается лениво — при первой векторизации (или явно через warm_up_model),
+поэтому запуски без новых постов не платят за импорт torch и загрузку модели.
+Все тексты батча кодируются одним вызовом encode: тексты сортируются по длине
+и режутся на пачки по EMBEDDING_BATCH_SIZE, чтобы в одной пачке было меньше паддинга.
+
+Бэкенд выбирается переменной EMBEDDING_BACKEND:
+    torch     — (по умолчанию) обычный прямой проход PyTorch;
+    onnx      — та же модель через ONNX Runtime;
+    onnx-int8 — ONNX Runtime с динамической int8-квантизацией (EMBEDDING_ONNX_QUANTIZATION:
+                avx2 / avx512 / avx512_vnni / arm64). Квантованная модель экспортируется
+                в папку модели при первом запуске.
+Для onnx-бэкендов нужен pip install "optimum[onnxruntime]".
+Совпадение с torch по косинусным оценкам проверяет benchmarks/embedding_backends.py.
+
+Результат encode_texts / encode_texts_async проходит через сокращение размерности
+(EMBEDDING_REDUCTION, см. reduction.py); в кэше лежат полные векторы.
+
+encode_texts_async не блокирует event loop: при EMBEDDING_WORKERS > 0 модель работает
+в отдельных процессах, между которыми делится батч (см. embedding_worker.py), иначе — в потоке.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, List
+import numpy as np
+from dotenv import load_dotenv
+from loguru import logger
+from src.startup_timing import timed_import
+from src.text_processing.embedding_cache import EmbeddingCache
+from src.text_processing.reduction import reduce_embeddings
+
+load_dotenv()
+
+# Размер пачки для одного прохода модели
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+# Число процессов векторизации (0 — считать в потоке основного процесса)
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "0"))
+
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+_model = None
+_embedding_cache = None
+_embedding_worker = None
+_model_lock = threading.Lock()
+# Кэш векторов не потокобезопасен, а encode_texts может работать в asyncio.to_thread
+_cache_lock = threading.Lock()
+
+
+def embedding_backend() -> str:
+    backend = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Неизвестный EMBEDDING_BACKEND: {backend} (ожидается одно из {EMBEDDING_BACKENDS})")
+    return backend
+
+
+def load_model(backend: str, model_path: str = None):
+    """
+    Загружает sentence-transformer с выбранным бэкендом (новый экземпляр при каждом вызове).
+
+    Args:
+        backend: "torch", "onnx" или "onnx-int8"
+        model_path: Папка модели (по умолчанию LOCAL_BERT_VECTOR_MODEL_PATH)
+    """
+    model_path = model_path or os.getenv("LOCAL_BERT_VECTOR_MODEL_PATH")
+    timed_import("torch")
+    sentence_transformers = timed_import("sentence_transformers")
+    SentenceTransformer = sentence_transformers.SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_path)
+    if backend == "onnx":
+        return SentenceTransformer(model_path, backend="onnx")
+
+    # onnx-int8: квантованный файл лежит рядом с моделью, экспортируем один раз
+    quantization = os.getenv("EMBEDDING_ONNX_QUANTIZATION", "avx2")
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if not os.path.exists(os.path.join(model_path, file_name)):
+        logger.info(f"🔧 Экспорт int8-модели ONNX ({quantization}) в {model_path}")
+        onnx_model = SentenceTransformer(model_path, backend="onnx")
+        sentence_transformers.export_dynamic_quantized_onnx_model(
+            onnx_model,
+            quantization_config=quantization,
+            model_name_or_path=model_path,
+            file_suffix=f"qint8_{quantization}",
+        )
+    return SentenceTransformer(model_path, backend="onnx", model_kwargs={"file_name": file_name})
+
+
+def get_model():
+    """
+    Возвращает общий экземпляр модели, загружая его при первом вызове.
+    Потокобезопасно: прогрев в фоне и первая векторизация не загрузят модель дважды.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                backend = embedding_backend()
+                start = time.perf_counter()
+                # Если не установлен sentence-transformers: pip install sentence-transformers
+                _model = load_model(backend)  # Модель скачана на диск (LOCAL_BERT_VECTOR_MODEL_PATH)
+                # _model = SentenceTransformer("all-mpnet-base-v2") # векторная размерность 768
+                # _model = SentenceTransformer("paraphrase-mpnet-base-v2")  # не поддерживается моим процессором
+                logger.info(f"⏱ Загрузка модели векторизации ({backend}): {time.perf_counter() - start:.2f} сек")
+    return _model
+
+
+def get_embedding_cache(dim: int = None) -> EmbeddingCache:
+    """
+    Кэш векторов: LRU в памяти + файл на диске (пустой EMBEDDING_CACHE_DIR отключает диск,
+    EMBEDDING_CACHE_DISK_MB ограничивает его размер, 0 — без ограничения).
+    Размерность можно передать явно, чтобы не загружать модель в основном процессе.
+    """
+    global _embedding_cache
+    if _embedding_cache is None:
+        # Векторы разных бэкендов немного различаются — кэшируем их раздельно
+        _embedding_cache = EmbeddingCache(
+            model_id=f"{os.getenv('LOCAL_BERT_VECTOR_MODEL_PATH', '')}|{embedding_backend()}",
+            dim=dim or get_model().get_sentence_embedding_dimension(),
+            cache_dir=os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache") or None,
+            max_memory_bytes=int(os.getenv("EMBEDDING_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+            max_disk_bytes=int(os.getenv("EMBEDDING_CACHE_DISK_MB", "512")) * 1024 * 1024,
+        )
+    return _embedding_cache
+
+
+def warm_up_model():
+    """
+    Загружает модель и прогоняет через неё короткий текст,
+    чтобы первая настоящая векторизация не ждала инициализации.
+    С процессами-воркерами модель грузится в них, а не здесь.
+    """
+    if EMBEDDING_WORKERS > 0:
+        return
+    start = time.perf_counter()
+    get_model().encode(["прогрев"], show_progress_bar=False)
+    get_embedding_cache()
+    logger.info(f"🔥 Модель векторизации прогрета за {time.perf_counter() - start:.2f} сек")
+
+
+def encode_texts(texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+    """
+    Кодирует список текстов в нормализованные векторы.
+    Уже встречавшиеся тексты берутся из кэша, модель считает только новые.
+
+    Args:
+        texts: Тексты для векторизации
+        batch_size: Сколько текстов обрабатывать за один проход модели
+
+    Returns:
+        np.ndarray: Матрица float32 (len(texts), dim), строки в порядке texts;
+            dim — размерность после сокращения (EMBEDDING_REDUCTION)
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    embedding_cache = get_embedding_cache()
+    embeddings = np.empty((len(texts), embedding_cache.dim), dtype=np.float32)
+
+    with _cache_lock:
+        cached, missing = embedding_cache.get_many(texts)
+    for i, vector in cached.items():
+        embeddings[i] = vector
+
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        computed = _encode_with_model(missing_texts, batch_size)
+        embeddings[missing] = computed
+        with _cache_lock:
+            embedding_cache.put_many(missing_texts, computed)
+    return reduce_embeddings(embeddings)
+
+
+def get_embedding_worker():
+    """Общий пул процессов векторизации (создаётся при первом обращении)."""
+    global _embedding_worker
+    if _embedding_worker is None:
+        from src.text_processing.embedding_worker import EmbeddingWorker
+        _embedding_worker = EmbeddingWorker(
+            workers=EMBEDDING_WORKERS,
+            batch_size=EMBEDDING_BATCH_SIZE,
+        )
+    return _embedding_worker
+
+
+def shutdown_embedding_worker():
+    global _embedding_worker
+    if _embedding_worker is not None:
+        _embedding_worker.close()
+        _embedding_worker = None
+
+
+async def encode_texts_async(texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+    """
+    То же, что encode_texts, но не блокирует event loop.
+    С EMBEDDING_WORKERS > 0 промахи кэша делятся между процессами-воркерами.
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    if EMBEDDING_WORKERS <= 0:
+        return await asyncio.to_thread(encode_texts, texts, batch_size)
+
+    worker = get_embedding_worker()
+    embedding_cache = get_embedding_cache(dim=await worker.dimension())
+    embeddings = np.empty((len(texts), embedding_cache.dim), dtype=np.float32)
+
+    with _cache_lock:
+        cached, missing = embedding_cache.get_many(texts)
+    for i, vector in cached.items():
+        embeddings[i] = vector
+
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        computed = await worker.encode(missing_texts)
+        embeddings[missing] = computed
+        with _cache_lock:
+            embedding_cache.put_many(missing_texts, computed)
+    return reduce_embeddings(embeddings)
+
+
+def embedding_cache_stats() -> Dict[str, int]:
+    """Счётчики попаданий/промахов кэша векторов за время жизни процесса."""
+    if _embedding_cache is None:
+        return {"embedding_cache_hits": 0, "embedding_cache_disk_hits": 0, "embedding_cache_misses": 0}
+    return _embedding_cache.stats()
+
+
+def _encode_with_model(texts: List[str], batch_size: int) -> np.ndarray:
+    # Сортируем по длине: соседние тексты в пачке близки по длине, паддинга меньше
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    sorted_embeddings = get_model().encode(
+        [texts[i] for i in order],
+        batch_size=batch_size,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+
+    embeddings = np.empty_like(sorted_embeddings, dtype=np.float32)
+    embeddings[order] = sorted_embeddings
+    return embeddings
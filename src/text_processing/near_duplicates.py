@@ -0,0 +1,173 @@
+"""
+Дешёвый поиск почти-дублей (MinHash + LSH) до векторизации.
+Копии постов, отличающиеся эмодзи, хэштегами или ссылкой в конце, ловятся
+по совпадению шинглов слов без трансформера и матрицы сходства.
+
+Подписи уже сохранённых постов лежат в базе:
+    near_dup_signatures — подпись MinHash каждого поста;
+    near_dup_bands      — бакеты LSH (полосы подписи) → URL поста.
+Хранятся только посты за последние NEAR_DUP_WINDOW_DAYS дней.
+"""
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from src.text_processing.normalization import normalize_text
+
+# Подпись: 128 хэш-функций = 16 полос по 8 значений.
+# Кандидаты находятся начиная примерно с Жаккара 0.7 ((1/16) ** (1/8)),
+# дальше их отсеивает порог NEAR_DUP_THRESHOLD по оценке из подписей.
+NUM_PERM = 128
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+
+# Шинглы — тройки слов; у слишком коротких текстов подпись не строится
+SHINGLE_SIZE = 3
+MIN_WORDS = 5
+
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+NEAR_DUP_WINDOW_DAYS = int(os.getenv("NEAR_DUP_WINDOW_DAYS", "7"))
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(1)
+# Фиксированное зерно: подписи в базе должны совпадать между запусками
+_PERM_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+
+CREATE_NEAR_DUP_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS near_dup_signatures (
+    original_post_url VARCHAR PRIMARY KEY,
+    signature BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS near_dup_bands (
+    bucket BIGINT NOT NULL,
+    original_post_url VARCHAR NOT NULL REFERENCES near_dup_signatures (original_post_url) ON DELETE CASCADE,
+    PRIMARY KEY (bucket, original_post_url)
+);
+CREATE INDEX IF NOT EXISTS near_dup_signatures_created_at_idx ON near_dup_signatures (created_at);
+"""
+
+# Таблицы создаются один раз за процесс, а не на каждый запрос
+_tables_ready = False
+
+
+async def _ensure_tables(conn):
+    global _tables_ready
+    if not _tables_ready:
+        await conn.execute(CREATE_NEAR_DUP_TABLES_SQL)
+        _tables_ready = True
+
+
+def text_words(text: str) -> List[str]:
+    """Слова текста без ссылок, хэштегов, эмодзи и пунктуации (см. normalization.normalize_text)."""
+    return normalize_text(text).split()
+
+
+def minhash_signature(text: str) -> Optional[np.ndarray]:
+    """Подпись MinHash (NUM_PERM значений uint64) или None, если текст слишком короткий."""
+    words = text_words(text)
+    if len(words) < MIN_WORDS:
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "big") for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    # (a * x + b) mod p для всех хэш-функций сразу; a, x < 2^32 — без переполнения uint64
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % _MERSENNE_PRIME
+    return permuted.min(axis=0)
+
+
+def band_buckets(signature: np.ndarray) -> List[int]:
+    """Ключи бакетов LSH — по одному на полосу, со знаком (колонка BIGINT)."""
+    buckets = []
+    for band in range(BANDS):
+        chunk = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(bytes([band]) + chunk.tobytes(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "big", signed=True))
+    return buckets
+
+
+def estimated_jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+
+def signature_to_bytes(signature: np.ndarray) -> bytes:
+    return signature.astype(">u8").tobytes()
+
+
+def signature_from_bytes(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=">u8").astype(np.uint64)
+
+
+async def find_near_duplicates(conn, signatures: List[Optional[np.ndarray]]) -> List[Tuple[Optional[str], float]]:
+    """
+    Для каждой подписи ищет самый похожий сохранённый пост одним запросом по бакетам.
+    Возвращает (URL, оценка Жаккара) или (None, 0.0), если кандидатов не нашлось.
+    """
+    result: List[Tuple[Optional[str], float]] = [(None, 0.0)] * len(signatures)
+    buckets_per_post = [band_buckets(sig) if sig is not None else [] for sig in signatures]
+    all_buckets = list({bucket for buckets in buckets_per_post for bucket in buckets})
+    if not all_buckets:
+        return result
+
+    await _ensure_tables(conn)
+    rows = await conn.fetch(
+        """
+        SELECT b.bucket, s.original_post_url, s.signature
+        FROM near_dup_bands b
+        JOIN near_dup_signatures s USING (original_post_url)
+        WHERE b.bucket = ANY($1::bigint[])
+          AND ($2::int <= 0 OR s.created_at >= NOW() - make_interval(days => $2::int))
+        """,
+        all_buckets, NEAR_DUP_WINDOW_DAYS
+    )
+    by_bucket: Dict[int, List[str]] = {}
+    stored: Dict[str, np.ndarray] = {}
+    for row in rows:
+        by_bucket.setdefault(row['bucket'], []).append(row['original_post_url'])
+        if row['original_post_url'] not in stored:
+            stored[row['original_post_url']] = signature_from_bytes(row['signature'])
+
+    for i, (signature, buckets) in enumerate(zip(signatures, buckets_per_post)):
+        candidates = {url for bucket in buckets for url in by_bucket.get(bucket, ())}
+        for url in candidates:
+            score = estimated_jaccard(signature, stored[url])
+            if score > result[i][1]:
+                result[i] = (url, score)
+    return result
+
+
+async def store_signatures(conn, urls: List[str], signatures: List[np.ndarray]):
+    """Добавляет подписи сохранённых постов в индекс и удаляет вышедшие из окна."""
+    if not urls:
+        return
+    await _ensure_tables(conn)
+    rows = await conn.fetch(
+        """
+        INSERT INTO near_dup_signatures (original_post_url, signature)
+        SELECT url, signature FROM unnest($1::text[], $2::bytea[]) AS t(url, signature)
+        ON CONFLICT DO NOTHING
+        RETURNING original_post_url
+        """,
+        urls, [signature_to_bytes(sig) for sig in signatures]
+    )
+    # Бакеты пишем только для новых подписей: у уже сохранённых они есть
+    inserted = {row['original_post_url'] for row in rows}
+    new = [(url, sig) for url, sig in zip(urls, signatures) if url in inserted]
+    if new:
+        await conn.execute(
+            """
+            INSERT INTO near_dup_bands (bucket, original_post_url)
+            SELECT bucket, url FROM unnest($1::bigint[], $2::text[]) AS t(bucket, url)
+            ON CONFLICT DO NOTHING
+            """,
+            [bucket for _, sig in new for bucket in band_buckets(sig)],
+            [url for url, _ in new for _ in range(BANDS)]
+        )
+    if NEAR_DUP_WINDOW_DAYS > 0:
+        await conn.execute(
+            "DELETE FROM near_dup_signatures WHERE created_at < NOW() - make_interval(days => $1::int)",
+            NEAR_DUP_WINDOW_DAYS
+        )
@@ -0,0 +1,42 @@
+"""
+Очистка и канонизация текста постов.
+clean_vk_text — та же очистка, что перед публикацией в Telegram (ссылки VK, хэштеги).
+normalize_text — канонический вид для поиска дублей: поверх clean_vk_text убирает
+все ссылки, приводит Юникод к NFKC, регистр — casefold, а пунктуацию, эмодзи
+и прочие символы заменяет пробелами. Посты, отличающиеся только этим, получают
+одинаковый normalized_hash.
+"""
+import hashlib
+import re
+import unicodedata
+from typing import Optional
+from src.vk_function import remove_vk_links_but_keep_text
+
+_VK_URL_RE = re.compile(r'https?://vk\.com[^\s]*')
+_HASHTAG_RE = re.compile(r"\s*#\S+")
+_URL_RE = re.compile(r"https?://\S+|www\.\S+")
+
+
+def clean_vk_text(text: str) -> str:
+    """Убирает разметку ссылок VK, ссылки на vk.com и хэштеги."""
+    text = text.replace("\\n", "\n").strip()
+    text = remove_vk_links_but_keep_text(text)
+    text = _VK_URL_RE.sub('', text)
+    return _HASHTAG_RE.sub("", text).strip()
+
+
+def normalize_text(text: str) -> str:
+    """Канонический вид текста: только буквы и цифры в нижнем регистре, через один пробел."""
+    text = _URL_RE.sub(" ", clean_vk_text(text))
+    text = unicodedata.normalize("NFKC", text).casefold()
+    # Буквы (L*) и цифры (N*) оставляем, остальное (пунктуация, эмодзи, модификаторы) — в пробел
+    chars = [ch if unicodedata.category(ch)[0] in "LN" else " " for ch in text]
+    return " ".join("".join(chars).split())
+
+
+def normalized_text_hash(text: str) -> Optional[str]:
+    """SHA-256 канонического текста (колонка posts.normalized_hash); None, если букв и цифр нет."""
+    normalized = normalize_text(text)
+    if not normalized:
+        return None
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
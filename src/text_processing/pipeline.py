@@ -1,29 +1,33 @@
 import asyncio
+import contextlib
 import hashlib
-import torch
 import os
 import time
-import requests
-import re
-import json
 from typing import List, Dict, Any, Optional, Union, Tuple
 from dotenv import load_dotenv
 from src.text_processing.ai.gigachat import rewrite_text_giga
 from src.text_processing.ai.deepseek import rewrite_text_deepseek
+from src.text_processing.ai.limits import get_provider_limiter, provider_name
+from src.text_processing.ai.rewrite_cache import RewriteCache, provider_fingerprint, rewrite_cache_key
+from src.text_processing.ai.router import RewriteRouter
+from src.text_processing.ai.batch import AI_BATCH_MAX_POSTS, batch_provider, plan_batches, rewrite_batch
 from loguru import logger
 from database.db import create_db_pool
 from datetime import datetime
-from sentence_transformers import SentenceTransformer, util
-from src.vk_function import remove_vk_links_but_keep_text
+from src.vk_fetcher import fetch_vk_last_posts, VK_REQUESTS_PER_SECOND
+from src.vk_resolve_cache import ScreenNameCache
+from src.text_processing.skip_log import SkipLogBuffer
+from src.text_processing.vector_codec import attach_vectors, stack_post_vectors, vectors_to_bytes
+from src.text_processing.semantic_index import get_semantic_index
+from src.text_processing.embeddings import encode_texts_async, embedding_cache_stats
+from src.text_processing.clustering import find_duplicate_groups
+from src.text_processing.normalization import clean_vk_text, normalized_text_hash
+from src.text_processing.near_duplicates import (
+    NEAR_DUP_THRESHOLD, minhash_signature, find_near_duplicates, store_signatures
+)
 
 load_dotenv()
 
-# Загружаем модель один раз при импорте модуля
-# Если не установлен sentence-transformers: pip install sentence-transformers
-model = SentenceTransformer(os.getenv("LOCAL_BERT_VECTOR_MODEL_PATH"))  # Модель скачана на диск
-# model = SentenceTransformer("all-mpnet-base-v2") # векторная размерность 768
-# model = SentenceTransformer("paraphrase-mpnet-base-v2")  # не поддерживается моим процессором
-
 # Порог косинусного сходства для семантических дублей
 SEMANTIC_THRESHOLD = 0.95
 
@@ -33,6 +37,17 @@ AI_DISABLED = False  # Поставь True для отключения AI
 # --- AI Provider Switcher ---
 def ai_provider():
     ai = os.getenv("AI_PROVIDER", "gigachat").lower()
+    if ai == "auto":
+        # Маршрутизация между всеми провайдерами, для которых задан токен
+        providers = {}
+        if os.getenv("GIGA_CHAT_TOKEN"):
+            providers["gigachat"] = rewrite_text_giga
+        if os.getenv("DEEPSEEK_TOKEN"):
+            providers["deepseek"] = rewrite_text_deepseek
+        if providers:
+            logger.info(f"AI-провайдер: авто ({', '.join(providers)})")
+            return RewriteRouter(providers)
+        logger.warning("⚠️ AI_PROVIDER=auto, но не задан ни GIGA_CHAT_TOKEN, ни DEEPSEEK_TOKEN — используем GigaChat")
     if ai == "deepseek":
         logger.info("AI-провайдер: DeepSeek")
         return rewrite_text_deepseek
@@ -43,10 +58,16 @@ def ai_provider():
 async def log_skipped_post(conn, new_post_url: str, reason: str,
                           hash_value: str = None, similar_post_url: str = None,
                           similarity: float = None, group_name: str = None,
-                          raw_text: str = None):
+                          raw_text: str = None, skip_log: Optional[SkipLogBuffer] = None):
     """
     Логирует пропущенный пост в таблицу skipped_posts.
+    Если передан skip_log — только добавляет запись в буфер,
+    в базу она попадёт при skip_log.flush().
     """
+    if skip_log is not None:
+        skip_log.add(new_post_url, reason, hash_value, similar_post_url, similarity, group_name, raw_text)
+        return
+
     # Получаем дату похожего поста из базы данных
     similar_post_date = None
     if similar_post_url:
@@ -71,10 +92,98 @@ async def log_skipped_post(conn, new_post_url: str, reason: str,
     )
 
 
-async def filter_by_hash(posts: List[dict], conn) -> tuple[List[dict], int]:  # Новый синтаксис
+# Колонки posts, которые добавляют миграции (database/migrations.py), а не исходная схема
+REQUIRED_POSTS_COLUMNS = ("normalized_hash",)
+_posts_schema_checked = False
+
+
+async def check_posts_schema(conn):
+    """
+    Проверяет, что в posts есть колонки, нужные пайплайну (REQUIRED_POSTS_COLUMNS).
+    Без них поиск дублей и сохранение постов падали бы на каждом посте,
+    поэтому при их отсутствии сразу выбрасывается RuntimeError.
+    """
+    global _posts_schema_checked
+    if _posts_schema_checked:
+        return
+    rows = await conn.fetch(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'posts' AND column_name = ANY($1::text[])
+        """,
+        list(REQUIRED_POSTS_COLUMNS)
+    )
+    missing = set(REQUIRED_POSTS_COLUMNS) - {row['column_name'] for row in rows}
+    if missing:
+        raise RuntimeError(
+            f"В таблице posts нет колонок {', '.join(sorted(missing))}: "
+            f"выполните миграции python -m database.migrations (database/migrations.py)"
+        )
+    _posts_schema_checked = True
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 хэш текста поста (колонка posts.hash)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+async def lookup_existing_posts(posts: List[dict], conn) -> Dict[str, Any]:
+    """
+    Одним запросом к базе находит, какие URL, хэши и нормализованные хэши
+    кандидатов уже есть в posts.
+    
+    Returns:
+        dict: {"urls": множество найденных original_post_url,
+               "hashes": {hash: original_post_url найденного поста},
+               "normalized_hashes": {normalized_hash: original_post_url найденного поста}}
+    """
+    urls = list({post.get("original_post_url") for post in posts if post.get("original_post_url")})
+    hashes = list({
+        text_hash(post.get("text", "").strip())
+        for post in posts if post.get("text", "").strip()
+    })
+    normalized_hashes = list({
+        normalized_text_hash(post.get("text", "")) for post in posts
+    } - {None})
+    rows = await conn.fetch(
+        """
+        SELECT 'url' AS kind, original_post_url AS key, original_post_url
+        FROM posts WHERE original_post_url = ANY($1::text[])
+        UNION ALL
+        SELECT 'hash' AS kind, hash AS key, original_post_url
+        FROM posts WHERE hash = ANY($2::text[])
+        UNION ALL
+        SELECT 'normalized_hash' AS kind, normalized_hash AS key, original_post_url
+        FROM posts WHERE normalized_hash = ANY($3::text[])
+        """,
+        urls, hashes, normalized_hashes
+    )
+    existing = {"urls": set(), "hashes": {}, "normalized_hashes": {}}
+    for row in rows:
+        if row['kind'] == 'url':
+            existing["urls"].add(row['key'])
+        elif row['kind'] == 'hash':
+            existing["hashes"][row['key']] = row['original_post_url']
+        else:
+            existing["normalized_hashes"][row['key']] = row['original_post_url']
+    return existing
+
+
+async def filter_by_hash(posts: List[dict], conn, existing: Optional[Dict[str, Any]] = None,
+                         skip_log: Optional[SkipLogBuffer] = None) -> tuple[List[dict], int]:  # Новый синтаксис
     """
     Фильтрация постов по хэшу (точные дубли) с проверкой в базе данных.
+    Кроме хэша исходного текста сравнивается хэш канонического текста
+    (см. normalization.py): посты, отличающиеся пробелами, эмодзи, пунктуацией,
+    регистром или ссылками, тоже считаются точными дублями.
+    Хэши всех постов проверяются одним запросом (см. lookup_existing_posts);
+    готовый результат можно передать через existing.
     """
+    if existing is None:
+        existing = await lookup_existing_posts(posts, conn)
+    existing_hashes = existing["hashes"]
+    existing_normalized = existing.get("normalized_hashes", {})
+
     unique_posts = []
     skipped = 0
     for post in posts:
@@ -82,35 +191,58 @@ async def filter_by_hash(posts: List[dict], conn) -> tuple[List[dict], int]:  #
         if not text:
             skipped += 1
             continue
-        hash_value = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        hash_value = text_hash(text)
         
         # Проверяем, есть ли такой хэш в базе данных
-        result = await conn.fetchrow("SELECT hash, original_post_url FROM posts WHERE hash = $1", hash_value)
-        if result:
+        if hash_value in existing_hashes:
             # Хэш уже есть в базе — пропускаем
             await log_skipped_post(
                 conn,
+                skip_log=skip_log,
                 new_post_url=post.get("original_post_url"),
                 reason="hash_duplicate",
                 hash_value=hash_value,
-                similar_post_url=result['original_post_url'],  # URL похожего поста
+                similar_post_url=existing_hashes[hash_value],  # URL похожего поста
+                group_name=post.get("group_name"),
+                raw_text=text
+            )
+            skipped += 1
+            continue
+
+        normalized_hash = normalized_text_hash(text)
+        if normalized_hash in existing_normalized:
+            await log_skipped_post(
+                conn,
+                skip_log=skip_log,
+                new_post_url=post.get("original_post_url"),
+                reason="normalized_hash_duplicate",
+                hash_value=normalized_hash,
+                similar_post_url=existing_normalized[normalized_hash],
                 group_name=post.get("group_name"),
                 raw_text=text
             )
             skipped += 1
             continue
         
-        # Добавляем хэш к посту для последующего сохранения
+        # Добавляем хэши к посту для последующего сохранения
         post['hash'] = hash_value
+        post['normalized_hash'] = normalized_hash
         unique_posts.append(post)
     return unique_posts, skipped
 
 
-async def filter_by_url(posts: List[dict], conn) -> tuple[List[dict], int]:
+async def filter_by_url(posts: List[dict], conn, existing: Optional[Dict[str, Any]] = None,
+                        skip_log: Optional[SkipLogBuffer] = None) -> tuple[List[dict], int]:
     """
     Фильтрация постов по оригинальному URL с проверкой в базе данных.
     Дополнительно проверяет дубли в рамках одной сессии.
+    URL всех постов проверяются одним запросом (см. lookup_existing_posts);
+    готовый результат можно передать через existing.
     """
+    if existing is None:
+        existing = await lookup_existing_posts(posts, conn)
+    existing_urls = existing["urls"]
+
     unique_posts = []
     skipped = 0
     seen_urls = set()  # Для отслеживания URL в рамках одной сессии
@@ -128,6 +260,7 @@ async def filter_by_url(posts: List[dict], conn) -> tuple[List[dict], int]:
         if url in seen_urls:
             await log_skipped_post(
                 conn,
+                skip_log=skip_log,
                 new_post_url=url,
                 reason="session_duplicate",
                 similar_post_url=url,
@@ -138,14 +271,14 @@ async def filter_by_url(posts: List[dict], conn) -> tuple[List[dict], int]:
             continue
         
         # Проверяем, есть ли такой URL в базе данных
-        result = await conn.fetchrow("SELECT original_post_url FROM posts WHERE original_post_url = $1", url)
-        if result:
+        if url in existing_urls:
             # URL уже есть в базе — пропускаем
             await log_skipped_post(
                 conn,
+                skip_log=skip_log,
                 new_post_url=url,
                 reason="url_duplicate",
-                similar_post_url=result['original_post_url'],  # URL похожего поста
+                similar_post_url=url,  # URL похожего поста
                 group_name=group_name,
                 raw_text=post.get("text", "")
             )
@@ -157,6 +290,40 @@ async def filter_by_url(posts: List[dict], conn) -> tuple[List[dict], int]:
         unique_posts.append(post)
     return unique_posts, skipped
 
+async def filter_by_near_duplicate(posts: List[dict], conn,
+                                   skip_log: Optional[SkipLogBuffer] = None) -> tuple[List[dict], int]:
+    """
+    Фильтрация почти-дублей по MinHash (см. near_duplicates.py) до векторизации.
+    Ловит копии уже сохранённых постов, отличающиеся эмодзи, хэштегами или ссылками,
+    без модели. Подпись сохраняется в post['minhash'] для записи в индекс в save_to_db.
+    """
+    signatures = [minhash_signature(post.get("text", "").strip()) for post in posts]
+    matches = await find_near_duplicates(conn, signatures)
+
+    unique_posts = []
+    skipped = 0
+    for post, signature, (similar_url, score) in zip(posts, signatures, matches):
+        if similar_url and score >= NEAR_DUP_THRESHOLD:
+            await log_skipped_post(
+                conn,
+                skip_log=skip_log,
+                new_post_url=post.get("original_post_url"),
+                reason="near_duplicate",
+                hash_value=post.get("hash"),
+                similar_post_url=similar_url,
+                similarity=score,
+                group_name=post.get("group_name"),
+                raw_text=post.get("text", "").strip()
+            )
+            logger.info(f"🔁 Почти-дубль ({score:.2f}): {post.get('original_post_url')} ≈ {similar_url}")
+            skipped += 1
+            continue
+        if signature is not None:
+            post['minhash'] = signature
+        unique_posts.append(post)
+    return unique_posts, skipped
+
+
 def select_best_post_from_group(posts: List[dict]) -> dict:
     """
     Выбирает лучший пост из группы семантических дублей.
@@ -214,7 +381,8 @@ def select_best_post_from_group(posts: List[dict]) -> dict:
     
     return best_post
 
-async def filter_by_semantic(posts: List[dict], conn) -> tuple[List[dict], int]:
+async def filter_by_semantic(posts: List[dict], conn,
+                             skip_log: Optional[SkipLogBuffer] = None) -> tuple[List[dict], int]:
     """
     Семантическая фильтрация постов с проверкой в базе данных.
     
@@ -224,80 +392,44 @@ async def filter_by_semantic(posts: List[dict], conn) -> tuple[List[dict], int]:
     unique_posts = []
     skipped = 0
     
-    # Получаем все векторы из базы данных для сравнения
-    db_vectors = await conn.fetch("SELECT vector_raw, original_post_url FROM posts WHERE vector_raw IS NOT NULL")
-    db_embeddings = []
-    db_urls = []
-    if db_vectors:
-        for row in db_vectors:
-            if row['vector_raw']:
-                # Преобразуем строку вектора обратно в тензор
-                vector_str = row['vector_raw']
-                # Убираем скобки и разделяем по запятой
-                # vector_list = [float(x) for x in vector_str.strip('[]').split(',')]  # Хрупкая конструкция
-                vector_list = json.loads(vector_str)  # Более точно и универсально
-                db_embeddings.append(torch.tensor(vector_list))
-                db_urls.append(row['original_post_url'])
-        
-        # ОТЛАДКА: выводим количество векторов для сравнения
-        logger.info(f"🔍 Загружено {len(db_embeddings)} векторов из базы для семантического сравнения")
-        # logger.info(f"🔍 URL'ы в базе: {db_urls}")
+    # Готовим поиск по уже сохранённым постам (см. semantic_index.py, SEMANTIC_BACKEND)
+    semantic_index = get_semantic_index()
+    await semantic_index.prepare(conn)
     
     # НОВАЯ ЛОГИКА: Сначала обрабатываем все посты и находим группы дублей
     processed_posts = []  # Посты с векторами
     semantic_groups = []  # Группы семантических дублей
     
-    # Шаг 1: Обрабатываем все посты и считаем векторы
+    # Шаг 1: Обрабатываем все посты и считаем векторы (весь батч одним вызовом модели)
     for post in posts:
         text = post.get("text", "").strip()
         if not text:
             skipped += 1
             continue
-        
-        emb = model.encode(text, convert_to_tensor=True, normalize_embeddings=True)
-        post['vector_raw'] = emb.tolist()  # Сохраняем вектор для последующего использования
         processed_posts.append(post)
     
-    # Шаг 2: Находим группы семантических дублей
-    used_indices = set()
+    embeddings = await encode_texts_async([post.get("text", "").strip() for post in processed_posts])
+    # Посты хранят только номер строки в общей матрице — без копии вектора в каждом посте
+    attach_vectors(processed_posts, embeddings)
     
-    for i, post in enumerate(processed_posts):
-        if i in used_indices:
-            continue
-        
-        # Создаём группу для текущего поста
-        current_group = [post]
-        used_indices.add(i)
-        
-        # Ищем похожие посты среди оставшихся
-        for j in range(i + 1, len(processed_posts)):
-            if j in used_indices:
-                continue
-            # === ЗАЩИТА: не сравниваем пост сам с собой ===
-            if processed_posts[i].get("original_post_url") == processed_posts[j].get("original_post_url"):
-                continue
-            
-            other_post = processed_posts[j]
-            
-            # Сравниваем векторы
-            emb1 = torch.tensor(post['vector_raw'])
-            emb2 = torch.tensor(other_post['vector_raw'])
-            similarity = float(util.cos_sim(emb1.unsqueeze(0), emb2.unsqueeze(0))[0][0])
-            
-            if similarity > SEMANTIC_THRESHOLD:
-                # Нашли дубль - добавляем в группу
-                current_group.append(other_post)
-                used_indices.add(j)
-                
-                logger.info(f"🔍 Найден семантический дубль в рамках запуска: {post.get('original_post_url')} <-> {other_post.get('original_post_url')} (сходство: {similarity:.4f})")
+    # Шаг 2: Находим группы семантических дублей (матрица сходства + компоненты связности)
+    groups = find_duplicate_groups(
+        embeddings,
+        SEMANTIC_THRESHOLD,
+        urls=[post.get("original_post_url") for post in processed_posts],
+    )
+    
+    for group_indices in groups:
+        current_group = [processed_posts[i] for i in group_indices]
         
         # Если группа содержит больше одного поста - это группа дублей
         if len(current_group) > 1:
             semantic_groups.append(current_group)
-            logger.info(f"🔍 Создана группа из {len(current_group)} семантических дублей")
+            urls = ", ".join(str(post.get('original_post_url')) for post in current_group)
+            logger.info(f"🔍 Создана группа из {len(current_group)} семантических дублей в рамках запуска: {urls}")
         else:
             # Одиночный пост - добавляем в уникальные
-            unique_posts.append(post)
+            unique_posts.append(current_group[0])
     
     # Шаг 3: Обрабатываем группы дублей
     for group in semantic_groups:
@@ -314,42 +446,37 @@ async def filter_by_semantic(posts: List[dict], conn) -> tuple[List[dict], int]:
     # Шаг 4: Проверяем с базой данных (старая логика для постов, которых нет в базе)
     final_unique_posts = []
     
-    for post in unique_posts:
+    # Ближайший пост в базе ищем сразу для всех кандидатов
+    queries = stack_post_vectors(unique_posts)
+    neighbours = await semantic_index.nearest(conn, queries)
+    
+    for post, (similar_url, max_sim) in zip(unique_posts, neighbours):
         # Сравниваем с векторами из базы данных
         is_duplicate_with_db = False
         
-        if db_embeddings:
-            emb = torch.tensor(post['vector_raw'])
-            db_batch = torch.stack(db_embeddings)
-            similarities = util.cos_sim(emb, db_batch)[0]
-            max_sim = float(similarities.max())
+        if similar_url is not None and max_sim > SEMANTIC_THRESHOLD:
+            logger.info(f"🔍 Семантический дубль с базой: {post.get('original_post_url')} -> {similar_url} (сходство: {max_sim:.4f})")
+            logger.info(f"🔍 Текст нового поста: '{post.get('text', '')[:100]}...'")
             
-            if max_sim > SEMANTIC_THRESHOLD:
-                # Находим индекс максимального сходства
-                max_idx = int(similarities.argmax())
-                similar_url = db_urls[max_idx] if max_idx < len(db_urls) else None
-                
-                logger.info(f"🔍 Семантический дубль с базой: {post.get('original_post_url')} -> {similar_url} (сходство: {max_sim:.4f})")
-                logger.info(f"🔍 Текст нового поста: '{post.get('text', '')[:100]}...'")
-                
-                # Получаем текст похожего поста для сравнения
-                similar_post_result = await conn.fetchrow("SELECT raw_text FROM posts WHERE original_post_url = $1", similar_url)
-                if similar_post_result:
-                    similar_text = similar_post_result['raw_text']
-                    logger.info(f"🔍 Текст похожего поста: '{similar_text[:100]}...'")
-                
-                # Логируем как семантический дубль
-                await log_skipped_post(
-                    conn,
-                    new_post_url=post.get("original_post_url"),
-                    reason="semantic_duplicate",
-                    similarity=max_sim,
-                    similar_post_url=similar_url,
-                    group_name=post.get("group_name"),
-                    raw_text=post.get("text", "")
-                )
-                skipped += 1
-                is_duplicate_with_db = True
+            # Получаем текст похожего поста для сравнения
+            similar_post_result = await conn.fetchrow("SELECT raw_text FROM posts WHERE original_post_url = $1", similar_url)
+            if similar_post_result:
+                similar_text = similar_post_result['raw_text']
+                logger.info(f"🔍 Текст похожего поста: '{similar_text[:100]}...'")
+            
+            # Логируем как семантический дубль
+            await log_skipped_post(
+                conn,
+                skip_log=skip_log,
+                new_post_url=post.get("original_post_url"),
+                reason="semantic_duplicate",
+                similarity=max_sim,
+                similar_post_url=similar_url,
+                group_name=post.get("group_name"),
+                raw_text=post.get("text", "")
+            )
+            skipped += 1
+            is_duplicate_with_db = True
         
         if not is_duplicate_with_db:
             final_unique_posts.append(post)
@@ -357,7 +484,8 @@ async def filter_by_semantic(posts: List[dict], conn) -> tuple[List[dict], int]:
     return final_unique_posts, skipped
 
 
-async def filter_by_video_size(posts: List[dict], conn) -> tuple[List[dict], int]:
+async def filter_by_video_size(posts: List[dict], conn,
+                              skip_log: Optional[SkipLogBuffer] = None) -> tuple[List[dict], int]:
     """
     Фильтрация постов по размеру видео файлов.
     Пропускает посты с видео больше 250MB.
@@ -417,6 +545,7 @@ async def filter_by_video_size(posts: List[dict], conn) -> tuple[List[dict], int
             # Если есть большие видео, пропускаем весь пост
             await log_skipped_post(
                 conn,
+                skip_log=skip_log,
                 new_post_url=post.get("original_post_url"),
                 reason="video_too_large",
                 group_name=post.get("group_name"),
@@ -429,13 +558,16 @@ async def filter_by_video_size(posts: List[dict], conn) -> tuple[List[dict], int
     
     return unique_posts, skipped
 
-async def rewrite_posts_ai(posts: List[dict], rewrite_func) -> tuple[List[dict], int]:  # Новый синтаксис
+async def rewrite_posts_ai(posts: List[dict], rewrite_func,
+                           cache: Optional[RewriteCache] = None) -> tuple[List[dict], int]:  # Новый синтаксис
     """
     Переписывает тексты постов через AI-провайдера (GigaChat/DeepSeek).
     
     Args:
         posts: Список постов с полем "text" (оригинальный текст)
         rewrite_func: Функция AI-переписывания (async или sync)
+        cache: Кэш переписываний (см. ai/rewrite_cache.py); найденные в нём тексты
+            не отправляются в AI, новые успешные результаты в него сохраняются
     
     Returns:
         tuple: (обновленные_посты, количество_переписанных)
@@ -447,63 +579,195 @@ async def rewrite_posts_ai(posts: List[dict], rewrite_func) -> tuple[List[dict],
         4. Сохраняет в post["rewritten_text"] и post["text"]
         5. При ошибке AI использует оригинал
         
+    Запросы к AI идут параллельно, в пределах лимитов провайдера
+    (одновременные запросы и запросы в минуту, см. ai/limits.py);
+    посты возвращаются в исходном порядке.
+        
     Каждый пост получает:
+        - post["original_text"] - исходный текст из VK (для БД и вектора рерайта)
         - post["rewritten_text"] - переписанный текст (для БД)
         - post["text"] - текст для Telegram (переписанный или оригинал)
     """
     logger.info(f"📝 Будет переписано {len(posts)} постов через AI...")
-    rewritten_count = 0
-    updated_posts = []
-    for post in posts:
-        original_text = post.get("text", "").strip()
+    provider = provider_name(rewrite_func)
+    # Маршрутизатор сам соблюдает лимиты каждого провайдера
+    limiter = None if isinstance(rewrite_func, RewriteRouter) else get_provider_limiter(provider)
+    is_async = asyncio.iscoroutinefunction(rewrite_func) or isinstance(rewrite_func, RewriteRouter)
+
+    # Ранее переписанные тексты берём из кэша одним запросом
+    use_cache = cache is not None and not AI_DISABLED
+    fingerprint = provider_fingerprint(rewrite_func) if use_cache else None
+    cache_keys = [rewrite_cache_key(post.get("text", "").strip(), fingerprint) for post in posts] if use_cache else []
+    cached = {}
+    if use_cache:
+        try:
+            cached = await cache.get_many(cache_keys)
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша переписываний: {e}")
+    new_rewrites = []  # (ключ, провайдер, текст) для сохранения в кэш
+
+    start = time.perf_counter()
+    # Короткие посты, которых нет в кэше, переписываем пакетами — по одному запросу на пакет.
+    # Пакетные запросы только запускаются: одиночные посты идут к AI одновременно с ними
+    batch_provider_name, batch_tasks = None, {}
+    if AI_BATCH_MAX_POSTS > 1 and not AI_DISABLED:
+        batch_provider_name, batch_tasks = start_batched_rewrites(posts, rewrite_func, {
+            i for i, key in enumerate(cache_keys) if key in cached
+        })
+
+    async def rewrite_post(i: int, post: dict) -> bool:
+        # post["text"] ниже заменяется рерайтом — исходный текст VK сохраняем отдельно
+        original_text = post.setdefault("original_text", post.get("text", "").strip())
         
         if AI_DISABLED:
             # ЗАТЫЧКА: просто копируем оригинальный текст
             post["rewritten_text"] = original_text
             # Для Telegram используем оригинальный текст
             post["text"] = original_text
-            rewritten_count += 1
             logger.info(f"🔧 ЗАТЫЧКА: текст скопирован для: {post.get('original_post_url')}")
-        else:
-            # Оригинальный код AI
+            return True
+
+        cache_key = cache_keys[i] if use_cache else None
+        if cache_key in cached:
+            post["rewritten_text"] = cached[cache_key]
+            post["text"] = cached[cache_key]
+            logger.success(f"✅ Текст взят из кэша переписываний для: {post.get('original_post_url')}")
+            return True
+
+        rewritten_text = (await batch_tasks[i]).get(i) if i in batch_tasks else None
+        # В кэш пишем провайдера, который действительно ответил (для маршрутизатора — победителя)
+        answered_by = batch_provider_name
+        if not rewritten_text or rewritten_text == original_text:
+            # Оригинальный код AI (и запасной путь для постов, не принятых из пакетного ответа)
             rewritten_text = None
+            answered_by = provider
             try:
-                # Проверяем, является ли функция асинхронной
-                if asyncio.iscoroutinefunction(rewrite_func):
-                    rewritten_text = await rewrite_func(original_text)
-                else:
-                    # Для синхронных функций используем asyncio.to_thread
-                    rewritten_text = await asyncio.to_thread(rewrite_func, original_text)
+                async with limiter or contextlib.nullcontext():
+                    # Проверяем, является ли функция асинхронной
+                    if isinstance(rewrite_func, RewriteRouter):
+                        rewritten_text, answered_by = await rewrite_func.rewrite(original_text)
+                    elif is_async:
+                        rewritten_text = await rewrite_func(original_text)
+                    else:
+                        # Для синхронных функций используем asyncio.to_thread
+                        rewritten_text = await asyncio.to_thread(rewrite_func, original_text)
             except Exception as e:
                 logger.error(f"Ошибка AI-переписывания: {e}")
-            if rewritten_text and rewritten_text.strip() and rewritten_text.strip() != original_text:
-                post["rewritten_text"] = rewritten_text.strip()
-                # Для Telegram используем переписанный текст
-                post["text"] = rewritten_text.strip()
-                rewritten_count += 1
-                logger.success(f"✅ Текст успешно переписан для: {post.get('original_post_url')}")
-            else:
-                post["rewritten_text"] = original_text
-                # Для Telegram используем оригинальный текст
-                post["text"] = original_text
-                logger.warning(f"⚠️ Не удалось переписать текст для: {post.get('original_post_url')}. Используем оригинал.")
-        
-        updated_posts.append(post)
-    return updated_posts, rewritten_count
+        if rewritten_text and rewritten_text.strip() and rewritten_text.strip() != original_text:
+            post["rewritten_text"] = rewritten_text.strip()
+            # Для Telegram используем переписанный текст
+            post["text"] = rewritten_text.strip()
+            if use_cache:
+                new_rewrites.append((cache_key, answered_by, rewritten_text.strip()))
+            logger.success(f"✅ Текст успешно переписан для: {post.get('original_post_url')}")
+            return True
+        post["rewritten_text"] = original_text
+        # Для Telegram используем оригинальный текст
+        post["text"] = original_text
+        logger.warning(f"⚠️ Не удалось переписать текст для: {post.get('original_post_url')}. Используем оригинал.")
+        return False
+
+    # gather сохраняет порядок результатов — посты остаются в исходном порядке.
+    # Пакетные и одиночные запросы выполняются одновременно, в пределах лимитов провайдера
+    results = await asyncio.gather(*(rewrite_post(i, post) for i, post in enumerate(posts)))
+    if batch_tasks:
+        accepted = sum(len(task.result()) for task in set(batch_tasks.values()))
+        logger.info(f"📦 Из пакетных ответов принято {accepted} из {len(batch_tasks)} постов")
+    if posts and not AI_DISABLED:
+        logger.info(f"⏱ Переписывание {len(posts)} постов заняло {time.perf_counter() - start:.1f} сек")
+    if new_rewrites:
+        try:
+            await cache.put_many(new_rewrites)
+        except Exception as e:
+            logger.error(f"Ошибка записи в кэш переписываний: {e}")
+    return list(posts), sum(results)
+
+def start_batched_rewrites(posts: List[dict], rewrite_func,
+                           skip: set) -> Tuple[Optional[str], Dict[int, asyncio.Task]]:
+    """
+    Запускает пакетное переписывание коротких постов (AI_BATCH_MAX_POSTS > 1, см. ai/batch.py).
+    Вызывается внутри работающего event loop; задачи не ждёт.
+    
+    Args:
+        posts: Список постов с полем "text"
+        rewrite_func: Функция AI-переписывания (провайдер или RewriteRouter)
+        skip: Индексы постов, которые переписывать не нужно (найдены в кэше)
+    
+    Returns:
+        tuple: (имя провайдера пакетов, {индекс поста: задача его пакета}). Задача возвращает
+        {индекс поста: переписанный текст} для принятых из пакетного ответа постов;
+        остальные посты rewrite_posts_ai переписывает по одному
+    """
+    texts = {
+        i: post.get("text", "").strip() for i, post in enumerate(posts)
+        if i not in skip and post.get("text", "").strip()
+    }
+    batches = plan_batches(texts)
+    if not batches:
+        return None, {}
+    provider = batch_provider(rewrite_func)
+    if provider is None:
+        logger.warning("⚠️ Провайдер не поддерживает пакетные запросы — посты переписываются по одному")
+        return None, {}
+    name, complete, system_prompt = provider
+    limiter = get_provider_limiter(name)
+
+    async def run_batch(batch: List[int]) -> Dict[int, str]:
+        try:
+            async with limiter:
+                return await rewrite_batch(complete, system_prompt, [(i, texts[i]) for i in batch])
+        except Exception as e:
+            logger.error(f"Ошибка пакетного AI-переписывания ({len(batch)} постов): {e}")
+            return {}
+
+    tasks = {}
+    for batch in batches:
+        task = asyncio.create_task(run_batch(batch))
+        tasks.update((i, task) for i in batch)
+    logger.info(
+        f"📦 {len(tasks)} постов отправляется в {name} {len(batches)} пакетными запросами (вместо {len(tasks)})"
+    )
+    return name, tasks
 
 async def save_to_db(posts: List[dict], pool) -> int:
     """
     Сохраняет обработанные посты в базу данных (таблица posts).
     Для каждого поста выполняет INSERT INTO posts ...
-    Возвращает количество успешно сохранённых постов.
+    Возвращает количество успешно сохранённых постов. В индексы семантического
+    поиска и почти-дублей попадают только действительно записанные строки.
     """
     inserted = 0
+    indexed_urls = []  # Посты с вектором — их добавляем в индекс семантического поиска
+    indexed_posts = []
+    signature_urls = []  # Посты с подписью MinHash — их добавляем в индекс почти-дублей
+    signatures = []
+
+    # Векторы переписанных текстов считаем заранее, одним вызовом модели на весь батч.
+    # post["text"] к этому моменту уже заменён рерайтом — сравниваем с исходным текстом
+    rewritten_to_encode = [
+        i for i, post in enumerate(posts)
+        if post.get("rewritten_text", "").strip()
+        and post.get("rewritten_text", "").strip() != post.get("original_text", post.get("text", "")).strip()
+    ]
+    rewritten_bytes = {}
+    try:
+        encoded = await encode_texts_async([posts[i].get("rewritten_text", "").strip() for i in rewritten_to_encode])
+        rewritten_bytes = dict(zip(rewritten_to_encode, vectors_to_bytes(encoded)))
+    except Exception as e:
+        logger.error(f"Ошибка при векторизации переписанного текста: {e}")
+
+    # Векторы оригиналов упаковываем в BYTEA разом, прямо из общей матрицы батча
+    with_vector = [i for i, post in enumerate(posts) if post.get('vector_batch') is not None]
+    raw_bytes = dict(zip(with_vector, vectors_to_bytes(stack_post_vectors([posts[i] for i in with_vector]))))
+
     async with pool.acquire() as conn:
-        for post in posts:
+        for i, post in enumerate(posts):
             try:
-                text = post.get("text", "").strip()
+                # post["text"] уже заменён рерайтом; raw_text и хэши — по исходному тексту VK
+                text = post.get("original_text", post.get("text", "")).strip()
                 rewritten_text = post.get("rewritten_text", "").strip()
-                hash_value = post.get('hash') or hashlib.sha256(text.encode("utf-8")).hexdigest()
+                hash_value = post.get('hash') or text_hash(text)
+                normalized_hash = post.get('normalized_hash')
                 original_post_url = post.get("original_post_url")
                 group_name = post.get("group_name")
                 post_date_str = post.get("post_date")
@@ -518,39 +782,50 @@ async def save_to_db(posts: List[dict], pool) -> int:
                 link_preview_url = link_preview.get("url")
                 link_preview_photo_url = link_preview.get("photo_url")
 
-                # Вектор оригинального текста
-                vector_raw = post.get('vector_raw')
-                vector_raw_str = None
-                if vector_raw:
-                    vector_raw_str = "[" + ",".join(map(str, vector_raw)) + "]"
-                
-                # Вектор переписанного текста
-                vector_rewritten = None
-                vector_rewritten_str = None
-                if rewritten_text and rewritten_text != text:
-                    try:
-                        rewritten_emb = model.encode(rewritten_text, normalize_embeddings=True)
-                        vector_rewritten = rewritten_emb.tolist()
-                        vector_rewritten_str = "[" + ",".join(map(str, vector_rewritten)) + "]"
-                    except Exception as e:
-                        logger.error(f"Ошибка при векторизации переписанного текста: {e}")
+                # Векторы оригинального и переписанного текста (упакованный float32 для BYTEA)
+                vector_raw_bytes = raw_bytes.get(i)
+                vector_rewritten_bytes = rewritten_bytes.get(i)
                 
-                await conn.execute(
+                post_id = await conn.fetchval(
                     """
                     INSERT INTO posts (
                         hash, raw_text, rewritten_text, vector_raw, vector_rewritten,
                         original_post_url, group_name, post_date,
-                        media_urls, gif_urls, video_urls, link_preview_url, link_preview_photo_url
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
+                        media_urls, gif_urls, video_urls, link_preview_url, link_preview_photo_url,
+                        normalized_hash
+                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)
                     ON CONFLICT (hash) DO NOTHING
+                    RETURNING id
                     """,
-                    hash_value, text, rewritten_text, vector_raw_str, vector_rewritten_str,
+                    hash_value, text, rewritten_text, vector_raw_bytes, vector_rewritten_bytes,
                     original_post_url, group_name, post_date,
-                    media_urls, gif_urls, video_urls, link_preview_url, link_preview_photo_url
+                    media_urls, gif_urls, video_urls, link_preview_url, link_preview_photo_url,
+                    normalized_hash
                 )
+                if post_id is None:
+                    # Пост с таким хэшем уже есть — строка не записана, в индексы её не добавляем
+                    logger.info(f"Пост уже есть в базе, пропускаем: {original_post_url}")
+                    continue
                 inserted += 1
+                if vector_raw_bytes is not None and original_post_url:
+                    indexed_urls.append(original_post_url)
+                    indexed_posts.append(post)
+                if post.get('minhash') is not None and original_post_url:
+                    signature_urls.append(original_post_url)
+                    signatures.append(post['minhash'])
             except Exception as e:
                 logger.error(f"Ошибка при сохранении поста в базу: {e}")
+
+        if indexed_urls:
+            try:
+                await get_semantic_index().add(conn, indexed_urls, stack_post_vectors(indexed_posts))
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении индекса семантического поиска: {e}")
+        if signature_urls:
+            try:
+                await store_signatures(conn, signature_urls, signatures)
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении индекса почти-дублей: {e}")
     logger.info(f"✅ В базу сохранено {inserted} постов.")
     return inserted
 
@@ -561,14 +836,29 @@ async def process_posts(posts: List[dict], pool) -> tuple[Dict[str, Any], List[d
     Возвращает кортеж: (статистика, список одобренных постов)
     """
     total = len(posts)
+    # Пропуски копятся в буфере и пишутся в skipped_posts одним запросом
+    skip_log = SkipLogBuffer()
     async with pool.acquire() as conn:
-        posts, skipped_by_url = await filter_by_url(posts, conn)
-        posts, skipped_by_hash = await filter_by_hash(posts, conn)
-        posts, skipped_by_semantic = await filter_by_semantic(posts, conn)
-        posts, skipped_by_size = await filter_by_video_size(posts, conn)
+        await check_posts_schema(conn)
+        try:
+            # URL и хэши всех кандидатов проверяем в базе одним запросом
+            existing = await lookup_existing_posts(posts, conn)
+            posts, skipped_by_url = await filter_by_url(posts, conn, existing, skip_log=skip_log)
+            posts, skipped_by_hash = await filter_by_hash(posts, conn, existing, skip_log=skip_log)
+            posts, skipped_by_near_duplicate = await filter_by_near_duplicate(posts, conn, skip_log=skip_log)
+            posts, skipped_by_semantic = await filter_by_semantic(posts, conn, skip_log=skip_log)
+            posts, skipped_by_size = await filter_by_video_size(posts, conn, skip_log=skip_log)
+        finally:
+            # Ошибка записи журнала пропусков не должна подменять исключение фильтров
+            pending_skips = len(skip_log)
+            try:
+                await skip_log.flush(conn)
+            except Exception as e:
+                logger.error(f"Ошибка записи {pending_skips} пропущенных постов в skipped_posts: {e}")
     
     rewrite_func = ai_provider()
-    posts, rewritten = await rewrite_posts_ai(posts, rewrite_func)
+    rewrite_cache = RewriteCache(pool)
+    posts, rewritten = await rewrite_posts_ai(posts, rewrite_func, cache=rewrite_cache)
 
     # Сохраняем финальный список одобренных постов для возврата
     approved_posts = posts.copy()
@@ -576,255 +866,75 @@ async def process_posts(posts: List[dict], pool) -> tuple[Dict[str, Any], List[d
     # передаём pool внутрь
     inserted = await save_to_db(posts, pool)
 
-    skipped = skipped_by_hash + skipped_by_url + skipped_by_semantic + skipped_by_size
+    skipped = skipped_by_hash + skipped_by_url + skipped_by_near_duplicate + skipped_by_semantic + skipped_by_size
     stats = {
         "total": total,
         "inserted": inserted,
         "skipped": skipped,
         "skipped_by_hash": skipped_by_hash,
         "skipped_by_url": skipped_by_url,
+        "skipped_by_near_duplicate": skipped_by_near_duplicate,
         "skipped_by_semantic": skipped_by_semantic,
         "skipped_by_size": skipped_by_size,
         "rewritten": rewritten,
-        "errors": 0
+        "errors": 0,
+        **embedding_cache_stats(),
+        **rewrite_cache.stats(),
     } 
+    if isinstance(rewrite_func, RewriteRouter):
+        # Гистограммы задержек AI-провайдеров
+        stats.update(rewrite_func.export_stats())
+        try:
+            rewrite_func.write_metrics()
+        except OSError as e:
+            logger.error(f"Не удалось записать метрики AI-провайдеров: {e}")
     
     return stats, approved_posts
 
-def get_vk_last_posts(
+async def get_vk_last_posts(
     access_token: str,
     group_names: List[str],
     count: int = 5,
     save_path: Optional[str] = None,
-    delay_between_requests: float = 0.3,
+    requests_per_second: float = VK_REQUESTS_PER_SECOND,
+    max_concurrency: int = 10,
+    use_execute: bool = False,
+    high_water_marks: Optional[Dict[str, dict]] = None,
 ) -> Tuple[List[Dict], Dict[str, Any]]:
     """
-    Получает последние посты из VK групп с улучшенной обработкой ошибок и настраиваемыми задержками.
+    Получает последние посты из VK групп.
+    Запросы к группам выполняются параллельно через общий ограничитель частоты
+    (см. src/vk_fetcher.py), поэтому функция не блокирует event loop.
     
     Args:
         access_token: VK API токен
         group_names: Список имен групп
         count: Количество постов для получения из каждой группы
         save_path: Путь для сохранения результатов (опционально)
-        delay_between_requests: Задержка между запросами в секундах (по умолчанию 0.3)
+        requests_per_second: Лимит запросов к VK API в секунду (по умолчанию 3)
+        max_concurrency: Максимум групп, обрабатываемых одновременно
+        use_execute: Пакетный режим — стены до 25 групп читаются одним запросом execute
+        high_water_marks: Последние увиденные посты по группам (см. database/vk_state.py).
+                          Если переданы — возвращаются только новые посты, а обновлённые
+                          отметки лежат в stats["high_water_marks"]
+        
+    Соответствие screen_name → owner_id кэшируется в файле VK_RESOLVE_CACHE_PATH
+    (по умолчанию vk_resolve_cache.json), пустое значение переменной отключает кэш.
     """
-    
-
-    
-    def get_group_info(access_token: str, group_name: str, api_version: str) -> dict:
-        """
-        Получает информацию о группе/пользователе через utils.resolveScreenName.
-        Работает с любыми форматами: screen_name, числовые ID, id123456789.
-        """
-        try:
-            # Используем utils.resolveScreenName для получения информации
-            response = requests.get(
-                "https://api.vk.com/method/utils.resolveScreenName",
-                params={
-                    "access_token": access_token,
-                    "v": api_version,
-                    "screen_name": group_name
-                },
-                timeout=10
-            ).json()
-            
-            if "error" in response:
-                raise Exception(f"VK API Error: {response['error']['error_msg']}")
-            
-            result = response["response"]
-            if not result:
-                raise Exception("Group not found")
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Failed to resolve screen name for {group_name}: {str(e)}")
-            raise
-    
-    api_url = "https://api.vk.com/method/"
-    api_version = "5.199"
-    all_posts = []
-    stats = {
-        "total_groups": len(group_names),
-        "processed_groups": 0,
-        "failed_groups": 0,
-        "skipped_types": {},
-        "total_posts": 0,
-        "reposts": 0,
-        "group_errors": {},  # Детальная информация об ошибках групп
-    }
-
-    for group in group_names:
-        # Определяем тип объекта для более информативного логирования
-        try:
-            group_info = get_group_info(access_token, group, api_version)
-            object_type = group_info["type"]
-            
-            if object_type == "group":
-                logger.info(f"👥 Fetching group data: {group}")
-            elif object_type == "page":
-                logger.info(f"📄 Fetching page data: {group}")
-            elif object_type == "user":
-                logger.info(f"👤 Fetching user data: {group}")
-            else:
-                logger.info(f"🌐 Fetching unknown data: {group}")
-        except:
-            # Если не удалось определить тип, используем общий формат
-            logger.info(f"🌐 Fetching data: {group}")
-
-        try:
-            # Получаем информацию о группе через utils.resolveScreenName
-            # group_info уже получен выше для логирования
-            
-            # Задержка между запросами
-            time.sleep(delay_between_requests)
-
-            # Определяем тип объекта и получаем ID
-            object_type = group_info["type"]  # "group" или "user"
-            object_id = group_info["object_id"]
-            
-            if object_type == "group" or object_type == "page":
-                group_id = -object_id  # Для групп и публичных страниц используем отрицательный ID
-                group_name = group  # Используем оригинальное имя
-            elif object_type == "user":
-                group_id = object_id  # Для пользователей используем положительный ID
-                group_name = group  # Используем оригинальное имя
-            else:
-                logger.warning(f"[Group Error] {group}: Unknown object type: {object_type}")
-                stats["failed_groups"] += 1
-                stats["group_errors"][group] = f"Unknown object type: {object_type}"
-                continue
-
-            # Запрос постов группы с таймаутом
-            wall_response = requests.get(
-                f"{api_url}wall.get",
-                params={
-                    "access_token": access_token,
-                    "v": api_version,
-                    "owner_id": group_id,
-                    "count": count
-                },
-                timeout=10  # Таймаут 10 секунд
-            ).json()
-            
-            # Задержка между запросами
-            time.sleep(delay_between_requests)
-
-            if "error" in wall_response:
-                error_msg = wall_response['error']['error_msg']
-                logger.warning(f"[Wall Error] {group}: {error_msg}")
-                stats["failed_groups"] += 1
-                stats["group_errors"][group] = error_msg
-                continue
-
-            stats["processed_groups"] += 1
-
-            for post in wall_response["response"]["items"]:
-                stats["total_posts"] += 1
-
-                post_id = post["id"]
-                post_url = f"https://vk.com/wall{group_id}_{post_id}"
-
-                post_date = datetime.utcfromtimestamp(post["date"]).strftime('%Y-%m-%d %H:%M:%S')
-                is_repost = "copy_history" in post
-                if is_repost:
-                    stats["reposts"] += 1
-
-                media_urls = []
-                video_urls = []
-                skipped_types = []
-                link_preview = None
-                doc_urls = []
-                gif_urls = []
-
-                for attach in post.get("attachments", []):
-                    att_type = attach.get("type")
-                    if att_type == "photo":
-                        sizes = attach["photo"]["sizes"]
-                        max_photo = max(sizes, key=lambda s: s["width"] * s["height"])
-                        media_urls.append(max_photo["url"])
-                    elif att_type == "video":
-                        video = attach.get("video", {})
-                        owner_id = video.get("owner_id")
-                        video_id = video.get("id")
-                        if owner_id is not None and video_id is not None:
-                            video_url = f"https://vk.com/video{owner_id}_{video_id}"
-                            video_urls.append(video_url)
-                    elif att_type == "link":
-                        link = attach.get("link", {})
-                        url = link.get("url")
-                        photo_url = None
-                        photo = link.get("photo")
-                        if photo:
-                            sizes = photo.get("sizes", [])
-                            if sizes:
-                                photo_url = sizes[-1].get("url")
-                        link_preview = {
-                            "url": url,
-                            "photo_url": photo_url
-                        }
-                    elif att_type == "doc":
-                        doc = attach.get("doc", {})
-                        ext = doc.get("ext")
-                        direct_url = doc.get("url")
-                        title = doc.get("title")
-
-                        if ext == "gif" and direct_url:
-                            gif_urls.append(direct_url)
-                        elif direct_url:
-                            doc_urls.append({
-                                "url": direct_url,
-                                "title": title,
-                                "ext": ext
-                            })
-                    else:
-                        skipped_types.append(att_type)
-                        stats["skipped_types"].setdefault(att_type, 0)
-                        stats["skipped_types"][att_type] += 1
-
-                if skipped_types:
-                    logger.info(f"📦 Post {post_url} skipped types: {', '.join(skipped_types)}")
-
-                all_posts.append({
-                    "text": post.get("text", "") if not is_repost else "",
-                    "media_urls": media_urls,
-                    "gif_urls": gif_urls,
-                    "video_urls": video_urls,
-                    "post_url": post_url,
-                    "date": post_date,
-                    "group_name": group_name,
-                    "is_repost": is_repost,
-                    "skipped_types": skipped_types,
-                    "link_preview": link_preview,
-                    "doc_urls": doc_urls,
-                })
-                
-        except requests.exceptions.Timeout:
-            logger.error(f"⏰ Timeout error for group {group}")
-            stats["failed_groups"] += 1
-            stats["group_errors"][group] = "Request timeout"
-            continue
-        except requests.exceptions.RequestException as e:
-            logger.error(f"🌐 Network error for group {group}: {str(e)}")
-            stats["failed_groups"] += 1
-            stats["group_errors"][group] = f"Network error: {str(e)}"
-            continue
-        except Exception as e:
-            logger.error(f"❌ Unexpected error for group {group}: {str(e)}")
-            stats["failed_groups"] += 1
-            stats["group_errors"][group] = f"Unexpected error: {str(e)}"
-            continue
-
-    logger.success(f"🎯 Обработано групп: {stats['processed_groups']}/{stats['total_groups']} | Постов: {stats['total_posts']} | Репостов: {stats['reposts']}")
-    if stats["failed_groups"]:
-        logger.warning(f"⚠️ Групп с ошибками: {stats['failed_groups']}")
-        # Выводим детали ошибок
-        for group, error in stats["group_errors"].items():
-            logger.warning(f"   • {group}: {error}")
-    if stats["skipped_types"]:
-        logger.info(f"📌 Пропущенные типы вложений: {stats['skipped_types']}")
-
-    return all_posts, stats
+    cache_path = os.getenv("VK_RESOLVE_CACHE_PATH", "vk_resolve_cache.json")
+    resolve_cache = ScreenNameCache(cache_path) if cache_path else None
+
+    return await fetch_vk_last_posts(
+        access_token=access_token,
+        group_names=group_names,
+        count=count,
+        save_path=save_path,
+        requests_per_second=requests_per_second,
+        max_concurrency=max_concurrency,
+        use_execute=use_execute,
+        resolve_cache=resolve_cache,
+        high_water_marks=high_water_marks,
+    )
 
 
 def prepare_vk_post_for_tg(
@@ -848,10 +958,7 @@ def prepare_vk_post_for_tg(
         grouped.setdefault(group, []).append(post)
 
     def prepare_post(post):
-        text = post.get("text", "").replace("\\n", "\n").strip()
-        text = remove_vk_links_but_keep_text(text)
-        text = re.sub(r'https?://vk\.com[^\s]*', '', text)
-        text = re.sub(r"\s*#\S+", "", text).strip()
+        text = clean_vk_text(post.get("text", ""))
         media_urls = post.get("media_urls", [])
         link_preview = post.get("link_preview", {})
         video_urls = post.get("video_urls", [])
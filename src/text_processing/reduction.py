@@ -0,0 +1,122 @@
+"""
+Сокращение размерности векторов для хранения и сравнения.
+Для грубого поиска дублей полная ширина вектора не нужна: короче вектор —
+меньше BYTEA в posts, памяти в индексе и работы в матрице сходства.
+
+Режим задаётся переменными окружения:
+    EMBEDDING_REDUCTION=none        — (по умолчанию) полная размерность;
+    EMBEDDING_REDUCTION=matryoshka  — первые EMBEDDING_REDUCED_DIM координат
+                                      (только для моделей, обученных с Matryoshka loss);
+    EMBEDDING_REDUCTION=pca         — проекция PCA на EMBEDDING_REDUCED_DIM компонент,
+                                      обученная на векторах из posts и сохранённая
+                                      рядом с моделью (pca_{dim}.npz).
+После сокращения векторы снова нормализуются.
+Смена режима требует пересчёта сохранённых векторов: python -m database.migrations.
+Выбрать размер помогает benchmarks/embedding_reduction.py.
+"""
+import os
+import numpy as np
+from loguru import logger
+
+EMBEDDING_REDUCTION_MODES = ("none", "matryoshka", "pca")
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return (matrix / np.maximum(norms, 1e-12)).astype(np.float32, copy=False)
+
+
+class MatryoshkaReducer:
+    """Обрезает вектор до первых dim координат."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def apply(self, matrix: np.ndarray) -> np.ndarray:
+        if matrix.ndim != 2 or matrix.shape[1] <= self.dim:
+            return matrix
+        return _normalize(matrix[:, :self.dim])
+
+
+class PcaReducer:
+    """Проекция на главные компоненты: (x - mean) @ components.T."""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray):
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+        self.dim = components.shape[0]
+
+    @classmethod
+    def fit(cls, matrix: np.ndarray, dim: int) -> "PcaReducer":
+        if len(matrix) < dim:
+            raise ValueError(f"Для PCA на {dim} компонент нужно хотя бы {dim} векторов, есть {len(matrix)}")
+        matrix = matrix.astype(np.float64)
+        mean = matrix.mean(axis=0)
+        # Строки vt — главные направления по убыванию дисперсии
+        _, singular_values, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+        explained = (singular_values[:dim] ** 2).sum() / (singular_values ** 2).sum()
+        logger.info(f"📐 PCA {matrix.shape[1]} → {dim}: сохранено {explained:.1%} дисперсии")
+        return cls(mean, vt[:dim])
+
+    @classmethod
+    def load(cls, path: str) -> "PcaReducer":
+        data = np.load(path)
+        return cls(data["mean"], data["components"])
+
+    def save(self, path: str):
+        np.savez(path, mean=self.mean, components=self.components)
+
+    def apply(self, matrix: np.ndarray) -> np.ndarray:
+        # Уже сокращённые векторы (например, из базы после миграции) не трогаем
+        if matrix.ndim != 2 or matrix.shape[1] != self.mean.shape[0]:
+            return matrix
+        return _normalize((matrix - self.mean) @ self.components.T)
+
+
+def reduction_mode() -> str:
+    mode = os.getenv("EMBEDDING_REDUCTION", "none").lower()
+    if mode not in EMBEDDING_REDUCTION_MODES:
+        raise ValueError(f"Неизвестный EMBEDDING_REDUCTION: {mode} (ожидается одно из {EMBEDDING_REDUCTION_MODES})")
+    return mode
+
+
+def reduced_dim() -> int:
+    return int(os.getenv("EMBEDDING_REDUCED_DIM", "256"))
+
+
+def pca_path(dim: int, model_path: str = None) -> str:
+    """Файл PCA лежит в папке модели: проекция имеет смысл только для её векторов."""
+    model_path = model_path or os.getenv("LOCAL_BERT_VECTOR_MODEL_PATH") or "."
+    return os.path.join(model_path, f"pca_{dim}.npz")
+
+
+_reducer = None
+_reducer_loaded = False
+
+
+def get_reducer():
+    """Общий редуктор для выбранного режима или None при EMBEDDING_REDUCTION=none."""
+    global _reducer, _reducer_loaded
+    if not _reducer_loaded:
+        mode, dim = reduction_mode(), reduced_dim()
+        if mode == "matryoshka":
+            _reducer = MatryoshkaReducer(dim)
+        elif mode == "pca":
+            path = pca_path(dim)
+            if not os.path.exists(path):
+                raise FileNotFoundError(
+                    f"Нет проекции PCA {path}: обучите её на векторах из posts (python -m database.migrations)"
+                )
+            _reducer = PcaReducer.load(path)
+        if _reducer is not None:
+            logger.info(f"📐 Сокращение размерности векторов: {mode}, {dim}")
+        _reducer_loaded = True
+    return _reducer
+
+
+def reduce_embeddings(matrix: np.ndarray) -> np.ndarray:
+    """Применяет выбранное сокращение размерности (без изменений при EMBEDDING_REDUCTION=none)."""
+    reducer = get_reducer()
+    if reducer is None or matrix.size == 0:
+        return matrix
+    return reducer.apply(matrix)
@@ -0,0 +1,433 @@
+"""
+Поиск ближайшего уже опубликованного поста для семантической дедупликации.
+Бэкенд выбирается переменной окружения SEMANTIC_BACKEND:
+    memory   — (по умолчанию) все векторы из posts загружаются в память процесса;
+    pgvector — поиск выполняет база по колонке posts.embedding (расширение pgvector, индекс HNSW);
+    hnsw     — локальный индекс HNSW на диске (pip install hnswlib), без расширений в базе.
+
+Сравнение можно ограничить окном свежести SEMANTIC_WINDOW_DAYS (по post_date, а если его нет —
+по created_at): новости дублируются в пределах нескольких дней, и сравнивать с полной
+историей обычно незачем. Окно округляется до целых суток. По умолчанию 0 — сравнивать
+со всей историей, как и раньше: с окном рерайт поста старше окна не считается дублем.
+"""
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from loguru import logger
+from src.startup_timing import timed_import
+from src.text_processing.vector_codec import vectors_from_bytes, vector_to_pgvector_text
+
+
+# Дата поста для окна свежести: дата в VK, а если её нет — время сохранения
+POST_DAY_SQL = "coalesce(post_date, created_at)::date"
+
+
+def semantic_window_days() -> int:
+    return int(os.getenv("SEMANTIC_WINDOW_DAYS", "0"))
+
+
+def hnsw_index_path() -> str:
+    return os.getenv("SEMANTIC_HNSW_PATH", ".semantic_index/posts.hnsw")
+
+
+def window_start(window_days: int) -> Optional[date]:
+    """Первый день окна свежести (None — окно не ограничено)."""
+    if window_days <= 0:
+        return None
+    return datetime.now().date() - timedelta(days=window_days)
+
+
+class _DayPartition:
+    """Нормализованные векторы и URL постов одного дня."""
+
+    def __init__(self):
+        self.urls: List[str] = []
+        self.chunks: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def append(self, urls: List[str], matrix: np.ndarray):
+        self.urls.extend(urls)
+        self.chunks.append(matrix)
+        self._matrix = None
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = self.chunks[0] if len(self.chunks) == 1 else np.vstack(self.chunks)
+            self.chunks = [self._matrix]
+        return self._matrix
+
+
+class InMemorySemanticIndex:
+    """
+    Держит в памяти векторы постов из окна свежести, разложенные по дням.
+    Первый prepare() загружает окно, следующие догружают только посты с id больше
+    уже загруженного и выбрасывают дни, вышедшие из окна, — объём памяти и матрицы
+    сходства ограничен окном, а не всей историей.
+    """
+
+    def __init__(self, window_days: int = 0):
+        self.window_days = window_days
+        self.partitions: Dict[date, _DayPartition] = {}
+        self.max_id = 0
+
+    @property
+    def size(self) -> int:
+        return sum(len(partition.urls) for partition in self.partitions.values())
+
+    async def prepare(self, conn):
+        start = window_start(self.window_days)
+        if start is not None:
+            for day in [day for day in self.partitions if day < start]:
+                del self.partitions[day]
+
+        rows = await conn.fetch(
+            f"""
+            SELECT id, vector_raw, original_post_url, {POST_DAY_SQL} AS day
+            FROM posts
+            WHERE vector_raw IS NOT NULL AND id > $1
+              AND ($2::date IS NULL OR {POST_DAY_SQL} >= $2::date)
+            ORDER BY id
+            """,
+            self.max_id, start
+        )
+        if not rows:
+            return
+        self.max_id = max(row['id'] for row in rows)
+        # Все векторы декодируются одним куском в непрерывную матрицу (n, dim), без разбора текста
+        matrix = _normalize(vectors_from_bytes([row['vector_raw'] for row in rows]))
+        by_day: Dict[date, List[int]] = {}
+        for i, row in enumerate(rows):
+            by_day.setdefault(row['day'], []).append(i)
+        for day, positions in by_day.items():
+            self.partitions.setdefault(day, _DayPartition()).append(
+                [rows[i]['original_post_url'] for i in positions], matrix[positions]
+            )
+        logger.info(
+            f"🔍 Загружено {len(rows)} векторов из базы, в окне {self.size} "
+            f"({len(self.partitions)} дн.) для семантического сравнения"
+        )
+
+    async def nearest(self, conn, queries: np.ndarray) -> List[Tuple[Optional[str], float]]:
+        """Для каждой строки queries возвращает (URL ближайшего поста, косинусное сходство)."""
+        result = [(None, 0.0)] * len(queries)
+        if not self.partitions or len(queries) == 0:
+            return result
+        dim = queries.shape[1]
+        if any(partition.matrix.shape[1] != dim for partition in self.partitions.values()):
+            # Векторы пересчитаны в другую размерность (EMBEDDING_REDUCTION, смена модели) — загружаем окно заново
+            logger.warning(f"⚠️ Размерность векторов в памяти не совпадает с запросами ({dim}) — перезагружаем из базы")
+            self.partitions = {}
+            self.max_id = 0
+            await self.prepare(conn)
+        partitions = [partition for partition in self.partitions.values() if partition.matrix.shape[1] == dim]
+        if len(partitions) < len(self.partitions):
+            logger.error(
+                f"❌ Часть векторов в базе не совпадает по размерности с запросами ({dim}) и пропущена при "
+                f"семантической проверке. Проверьте EMBEDDING_REDUCTION и выполните python -m database.migrations"
+            )
+        best_sim = np.full(len(queries), -np.inf, dtype=np.float32)
+        queries = _normalize(queries)
+        # Ищем по дням: матрица сходства никогда не больше (запросы × посты одного дня)
+        for partition in partitions:
+            similarities = queries @ partition.matrix.T
+            best = similarities.argmax(axis=1)
+            scores = similarities[np.arange(len(queries)), best]
+            better = scores > best_sim
+            best_sim[better] = scores[better]
+            for row in np.flatnonzero(better):
+                result[row] = (partition.urls[best[row]], float(scores[row]))
+        return result
+
+    async def add(self, conn, urls: List[str], vectors: np.ndarray):
+        # Новые посты попадут в свои дни при следующем prepare() (догрузка по id)
+        pass
+
+
+class PgVectorSemanticIndex:
+    """
+    Ищет ближайший пост в базе: колонка posts.embedding типа vector с индексом HNSW
+    (создаётся миграцией migrate_pgvector в database/migrations.py).
+    Для всех новых постов выполняется один запрос.
+
+    Индекс HNSW строится по всей истории, а условие окна pgvector применяет уже после
+    обхода индекса — к hnsw.ef_search кандидатам. При большой истории почти все они
+    старше окна, и свежий дубль не находится. Поэтому с окном свежести посты окна
+    сначала выбираются по индексу на дате поста (MATERIALIZED CTE), а ближайший
+    ищется точным перебором среди них; без окна используется индекс HNSW.
+    """
+
+    def __init__(self, window_days: int = 0):
+        self.window_days = window_days
+
+    async def prepare(self, conn):
+        pass
+
+    async def nearest(self, conn, queries: np.ndarray) -> List[Tuple[Optional[str], float]]:
+        if len(queries) == 0:
+            return []
+        lateral = """
+            SELECT q.idx, n.original_post_url, n.similarity
+            FROM unnest($1::text[]) WITH ORDINALITY AS q(emb, idx)
+            CROSS JOIN LATERAL (
+                SELECT original_post_url, 1 - (embedding <=> q.emb::vector) AS similarity
+                FROM {source}
+                WHERE embedding IS NOT NULL
+                ORDER BY embedding <=> q.emb::vector
+                LIMIT 1
+            ) n
+        """
+        embeddings = [vector_to_pgvector_text(vector) for vector in queries]
+        start = window_start(self.window_days)
+        if start is None:
+            rows = await conn.fetch(lateral.format(source="posts"), embeddings)
+        else:
+            rows = await conn.fetch(
+                f"""
+                WITH recent AS MATERIALIZED (
+                    SELECT original_post_url, embedding FROM posts
+                    WHERE embedding IS NOT NULL AND {POST_DAY_SQL} >= $2::date
+                )
+                {lateral.format(source="recent")}
+                """,
+                embeddings, start
+            )
+        result = [(None, 0.0)] * len(queries)
+        for row in rows:
+            result[row['idx'] - 1] = (row['original_post_url'], float(row['similarity']))
+        return result
+
+    async def add(self, conn, urls: List[str], vectors: np.ndarray):
+        await conn.executemany(
+            "UPDATE posts SET embedding = $2::vector WHERE original_post_url = $1",
+            [(url, vector_to_pgvector_text(vector)) for url, vector in zip(urls, vectors)]
+        )
+
+
+class HnswSemanticIndex:
+    """
+    Локальный индекс HNSW (hnswlib) с векторами всех сохранённых постов.
+
+    На диске два файла: {path} — сам индекс, {path}.meta.json — размерность,
+    максимальный posts.id на момент последней синхронизации, URL постов
+    (метка вектора в индексе = номер URL в списке) и день каждого поста.
+    Окно свежести применяется фильтром при поиске, индекс хранит всю историю.
+    prepare() догружает посты, появившиеся в базе после последней синхронизации,
+    и перестраивает индекс целиком, если файла нет или он не совпадает с базой.
+    """
+
+    def __init__(self, path: str, window_days: int = 0, m: int = 16, ef_construction: int = 200,
+                 ef_search: int = 64):
+        self.hnswlib = timed_import("hnswlib")
+        self.path = path
+        self.window_days = window_days
+        self.meta_path = f"{path}.meta.json"
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = None
+        self.dim: Optional[int] = None
+        self.max_id = 0
+        self.urls: List[str] = []
+        self.days: List[int] = []  # date.toordinal() поста по метке
+        self.labels = {}  # original_post_url -> метка в индексе
+
+    # --- Файлы ---
+
+    def _load(self) -> bool:
+        if not os.path.exists(self.path) or not os.path.exists(self.meta_path):
+            return False
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            index = self.hnswlib.Index(space="cosine", dim=meta["dim"])
+            index.load_index(self.path, max_elements=max(len(meta["urls"]), 1))
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать индекс HNSW {self.path}: {e}")
+            return False
+        if "days" not in meta or len(meta["days"]) != len(meta["urls"]):
+            logger.info("🔁 Индекс HNSW без дат постов — будет перестроен")
+            return False
+        if index.get_current_count() != len(meta["urls"]):
+            logger.warning("⚠️ Индекс HNSW и список URL разошлись — индекс будет перестроен")
+            return False
+        self.index = index
+        self.dim = meta["dim"]
+        self.max_id = meta["max_id"]
+        self.urls = meta["urls"]
+        self.days = meta["days"]
+        self.labels = {url: label for label, url in enumerate(self.urls)}
+        self.index.set_ef(self.ef_search)
+        return True
+
+    @staticmethod
+    def remove_files(path: str) -> bool:
+        """Удаляет индекс и его meta-файл (например, после смены размерности векторов)."""
+        removed = False
+        for file_path in (path, f"{path}.meta.json"):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                removed = True
+        return removed
+
+    def _save(self):
+        # Пишем во временные файлы и подменяем: оборванная запись не испортит индекс
+        index_tmp, meta_tmp = f"{self.path}.tmp", f"{self.meta_path}.tmp"
+        self.index.save_index(index_tmp)
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "max_id": self.max_id, "urls": self.urls, "days": self.days}, f)
+        os.replace(index_tmp, self.path)
+        os.replace(meta_tmp, self.meta_path)
+
+    def _create(self, dim: int, capacity: int):
+        self.index = self.hnswlib.Index(space="cosine", dim=dim)
+        self.index.init_index(max_elements=max(capacity, 1024), ef_construction=self.ef_construction, M=self.m)
+        self.index.set_ef(self.ef_search)
+        self.dim = dim
+        self.max_id = 0
+        self.urls = []
+        self.days = []
+        self.labels = {}
+
+    def _insert(self, urls: List[str], vectors: np.ndarray, days: List[date]) -> int:
+        new = [(url, vector, day) for url, vector, day in zip(urls, vectors, days) if url not in self.labels]
+        if not new:
+            return 0
+        if self.index is None:
+            self._create(vectors.shape[1], len(new))
+        needed = len(self.urls) + len(new)
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(max(needed, self.index.get_max_elements() * 2))
+        labels = np.arange(len(self.urls), needed)
+        self.index.add_items(np.asarray([vector for _, vector, _ in new], dtype=np.float32), labels)
+        for label, (url, _, day) in zip(labels, new):
+            self.labels[url] = int(label)
+            self.urls.append(url)
+            self.days.append(day.toordinal())
+        return len(new)
+
+    # --- Синхронизация с базой ---
+
+    async def prepare(self, conn):
+        stats = await conn.fetchrow(
+            """
+            SELECT count(*) AS total, coalesce(max(id), 0) AS max_id,
+                   (SELECT octet_length(vector_raw) FROM posts
+                    WHERE vector_raw IS NOT NULL ORDER BY id DESC LIMIT 1) AS vector_bytes
+            FROM posts WHERE vector_raw IS NOT NULL
+            """
+        )
+        if self.index is None:
+            self._load()
+
+        # Посты удалялись или индекс от другой базы — проще собрать заново
+        if self.index is not None and (len(self.urls) > stats['total'] or self.max_id > stats['max_id']):
+            logger.info("🔁 Индекс HNSW не совпадает с базой — перестраиваем")
+            self.index = None
+        # Векторы в базе пересчитаны в другую размерность (EMBEDDING_REDUCTION) — старый индекс бесполезен
+        db_dim = stats['vector_bytes'] // 4 if stats['vector_bytes'] else None
+        if self.index is not None and db_dim is not None and db_dim != self.dim:
+            logger.warning(
+                f"⚠️ Размерность индекса HNSW ({self.dim}) не совпадает с векторами в базе ({db_dim}) — перестраиваем"
+            )
+            self.index = None
+        if self.index is None:
+            self.max_id = 0
+            self.urls = []
+            self.days = []
+            self.labels = {}
+
+        if stats['max_id'] <= self.max_id:
+            return
+
+        rows = await conn.fetch(
+            f"""
+            SELECT vector_raw, original_post_url, {POST_DAY_SQL} AS day
+            FROM posts WHERE vector_raw IS NOT NULL AND id > $1 ORDER BY id
+            """,
+            self.max_id
+        )
+        rows = [row for row in rows if row['original_post_url']]
+        added = 0
+        if rows:
+            vectors = vectors_from_bytes([row['vector_raw'] for row in rows])
+            if self.index is not None and vectors.shape[1] != self.dim:
+                logger.info("🔁 Размерность векторов изменилась — индекс HNSW перестраивается")
+                self.index = None
+                await self.prepare(conn)
+                return
+            added = self._insert([row['original_post_url'] for row in rows], vectors, [row['day'] for row in rows])
+            # Посты, добавленные из save_to_db, получают настоящий день из базы
+            for row in rows:
+                self.days[self.labels[row['original_post_url']]] = row['day'].toordinal()
+        self.max_id = stats['max_id']
+        if self.index is not None:
+            self._save()
+        logger.info(f"🔍 Индекс HNSW: {len(self.urls)} векторов, добавлено из базы {added}")
+
+    async def nearest(self, conn, queries: np.ndarray) -> List[Tuple[Optional[str], float]]:
+        if self.index is None or not self.urls or len(queries) == 0:
+            return [(None, 0.0)] * len(queries)
+        if queries.shape[1] != self.dim:
+            logger.error(
+                f"❌ Размерность запросов ({queries.shape[1]}) не совпадает с индексом HNSW ({self.dim}): "
+                f"семантическая проверка пропущена. Проверьте EMBEDDING_REDUCTION и выполните python -m database.migrations"
+            )
+            return [(None, 0.0)] * len(queries)
+        start = window_start(self.window_days)
+        window_filter = None
+        if start is not None:
+            first_day = start.toordinal()
+            if not any(day >= first_day for day in self.days):
+                return [(None, 0.0)] * len(queries)
+            window_filter = lambda label: self.days[label] >= first_day
+        try:
+            labels, distances = self.index.knn_query(np.asarray(queries, dtype=np.float32), k=1, filter=window_filter)
+        except RuntimeError:
+            # hnswlib не нашёл соседа в окне хотя бы для одного запроса
+            return [await self._nearest_one(query, window_filter) for query in queries]
+        # space="cosine": расстояние = 1 - косинусное сходство
+        return [(self.urls[int(label[0])], 1.0 - float(distance[0])) for label, distance in zip(labels, distances)]
+
+    async def _nearest_one(self, query: np.ndarray, window_filter) -> Tuple[Optional[str], float]:
+        try:
+            labels, distances = self.index.knn_query(np.asarray([query], dtype=np.float32), k=1, filter=window_filter)
+        except RuntimeError:
+            return None, 0.0
+        return self.urls[int(labels[0][0])], 1.0 - float(distances[0][0])
+
+    async def add(self, conn, urls: List[str], vectors: np.ndarray):
+        # День поста пока не знаем — считаем сегодняшним, prepare() уточнит его по базе
+        if self._insert(urls, vectors, [datetime.now().date()] * len(urls)):
+            self._save()
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+_semantic_index = None
+
+
+def get_semantic_index():
+    """Возвращает общий экземпляр бэкенда, выбранного в SEMANTIC_BACKEND."""
+    global _semantic_index
+    if _semantic_index is None:
+        backend = os.getenv("SEMANTIC_BACKEND", "memory").lower()
+        window_days = semantic_window_days()
+        logger.info(f"Окно семантического сравнения: {f'{window_days} дн.' if window_days > 0 else 'вся история'}")
+        if backend == "pgvector":
+            logger.info("Семантический поиск: pgvector")
+            _semantic_index = PgVectorSemanticIndex(window_days)
+        elif backend == "hnsw":
+            path = hnsw_index_path()
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            logger.info(f"Семантический поиск: локальный индекс HNSW ({path})")
+            _semantic_index = HnswSemanticIndex(path, window_days)
+        else:
+            logger.info("Семантический поиск: в памяти процесса")
+            _semantic_index = InMemorySemanticIndex(window_days)
+    return _semantic_index
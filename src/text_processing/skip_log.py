@@ -0,0 +1,59 @@
+"""
+Буфер записей для таблицы skipped_posts.
+Фильтры складывают сюда пропущенные посты, а в базу они пишутся
+одним запросом в конце обработки, а не INSERT-ом на каждый пропуск.
+"""
+from typing import List, Optional, Tuple
+from loguru import logger
+
+
+# Дата похожего поста подтягивается в том же запросе через JOIN с posts
+FLUSH_SKIPPED_POSTS_SQL = """
+INSERT INTO skipped_posts (
+    new_post_url, reason, hash, similar_post_url, similarity, group_name, raw_text, similar_post_date
+)
+SELECT r.new_post_url, r.reason, r.hash, r.similar_post_url, r.similarity, r.group_name, r.raw_text,
+       p.created_at
+FROM unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::float8[], $6::text[], $7::text[])
+     AS r(new_post_url, reason, hash, similar_post_url, similarity, group_name, raw_text)
+LEFT JOIN LATERAL (
+    SELECT created_at FROM posts WHERE original_post_url = r.similar_post_url LIMIT 1
+) p ON TRUE
+ON CONFLICT (new_post_url, reason, hash) DO NOTHING
+"""
+
+
+class SkipLogBuffer:
+    """Накопитель строк skipped_posts за один запуск пайплайна."""
+
+    def __init__(self):
+        self._rows: List[Tuple] = []
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, new_post_url: str, reason: str,
+            hash_value: str = None, similar_post_url: str = None,
+            similarity: float = None, group_name: str = None,
+            raw_text: str = None):
+        self._rows.append((
+            new_post_url, reason, hash_value, similar_post_url,
+            float(similarity) if similarity is not None else None,
+            group_name, raw_text
+        ))
+
+    async def flush(self, conn) -> int:
+        """
+        Записывает накопленные строки одним запросом и очищает буфер.
+        Возвращает количество отправленных строк.
+        """
+        if not self._rows:
+            return 0
+
+        rows = self._rows
+        self._rows = []
+        # Раскладываем строки по колонкам для unnest
+        columns: List[List[Optional[object]]] = [list(column) for column in zip(*rows)]
+        await conn.execute(FLUSH_SKIPPED_POSTS_SQL, *columns)
+        logger.info(f"🗒 В skipped_posts записано {len(rows)} пропусков одним запросом")
+        return len(rows)
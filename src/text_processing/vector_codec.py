@@ -0,0 +1,66 @@
+"""
+Бинарное представление векторов для колонок posts.vector_raw / posts.vector_rewritten (BYTEA).
+Вектор хранится как упакованный массив float32 в сетевом порядке байт (big-endian) —
+ровно в том формате, который даёт float4send() в PostgreSQL, поэтому миграция
+старых JSON-строк выполняется прямо в SQL (см. database/migrations.py).
+
+Внутри пайплайна векторы батча лежат одной непрерывной матрицей float32,
+а пост хранит только ссылку на неё и номер строки (attach_vectors / post_vector).
+В bytes они превращаются только на границе с базой.
+"""
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+# float32, big-endian: совпадает с float4send() в PostgreSQL
+VECTOR_DTYPE = np.dtype(">f4")
+
+
+def vectors_from_bytes(blobs: Sequence[bytes]) -> np.ndarray:
+    """
+    Декодирует набор BYTEA-векторов одной размерности в непрерывную матрицу float32 (n, dim).
+    Без разбора текста: все блобы склеиваются и читаются одним np.frombuffer.
+    """
+    if not blobs:
+        return np.empty((0, 0), dtype=np.float32)
+    dim = len(blobs[0]) // VECTOR_DTYPE.itemsize
+    buffer = b"".join(blobs)
+    if len(buffer) != len(blobs) * dim * VECTOR_DTYPE.itemsize:
+        raise ValueError("Векторы в базе имеют разную размерность")
+    return np.frombuffer(buffer, dtype=VECTOR_DTYPE).reshape(len(blobs), dim).astype(np.float32)
+
+
+def vectors_to_bytes(matrix: np.ndarray) -> List[bytes]:
+    """Упаковывает строки матрицы (n, dim) в bytes для BYTEA одной конвертацией порядка байт."""
+    packed = np.ascontiguousarray(matrix, dtype=VECTOR_DTYPE)
+    return [row.tobytes() for row in packed]
+
+
+def attach_vectors(posts: List[Dict], matrix: np.ndarray):
+    """Связывает посты со строками общей матрицы векторов (без копирования)."""
+    for i, post in enumerate(posts):
+        post['vector_batch'] = matrix
+        post['vector_index'] = i
+
+
+def post_vector(post: Dict) -> Optional[np.ndarray]:
+    """Вектор поста — представление строки общей матрицы, или None, если вектора нет."""
+    matrix = post.get('vector_batch')
+    if matrix is None:
+        return None
+    return matrix[post['vector_index']]
+
+
+def stack_post_vectors(posts: List[Dict]) -> np.ndarray:
+    """Матрица векторов постов (все посты должны иметь вектор)."""
+    if not posts:
+        return np.empty((0, 0), dtype=np.float32)
+    matrix = posts[0]['vector_batch']
+    if all(post['vector_batch'] is matrix for post in posts):
+        # Обычный случай — один батч: одна выборка строк по индексам
+        return matrix[[post['vector_index'] for post in posts]]
+    return np.stack([post_vector(post) for post in posts]).astype(np.float32, copy=False)
+
+
+def vector_to_pgvector_text(vector) -> str:
+    """Текстовый литерал pgvector вида '[0.1,0.2,...]' (приводится к типу через ::vector)."""
+    return "[" + ",".join(f"{float(x):.7g}" for x in np.asarray(vector).ravel()) + "]"
@@ -0,0 +1,665 @@
+"""
+Асинхронный сбор постов из VK.
+Держит много запросов wall.get одновременно, но не превышает лимит VK API
+на количество запросов в секунду для одного токена (общий token bucket).
+"""
+import asyncio
+import json
+import re
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+import aiohttp
+from loguru import logger
+
+from src.vk_resolve_cache import ScreenNameCache, match_groups_to_names
+
+VK_API_URL = "https://api.vk.com/method/"
+VK_API_VERSION = "5.199"
+
+# Лимит VK API: 3 запроса в секунду для пользовательского токена (20 — для токена сообщества)
+VK_REQUESTS_PER_SECOND = 3
+
+# Код ошибки VK "Too many requests per second"
+VK_ERROR_TOO_MANY_REQUESTS = 6
+
+# Код ошибки VK "One of the parameters specified was missing or invalid"
+VK_ERROR_INVALID_PARAM = 100
+
+# Метод execute выполняет не больше 25 вызовов API за один запрос
+VK_EXECUTE_BATCH_SIZE = 25
+
+# groups.getById принимает не больше 500 идентификаторов за запрос
+VK_GROUPS_GET_BY_ID_LIMIT = 500
+
+# Сколько страниц wall.get максимум догружаем для группы, если с прошлого запуска
+# вышло больше count постов (защита от бесконечной догрузки после долгого простоя)
+VK_MAX_CATCHUP_PAGES = 10
+
+# Ошибки доступа к стене: после них запись кэша screen_name считается устаревшей
+# 15 — Access denied, 18 — страница удалена/заблокирована, 30 — приватный профиль, 203 — нет доступа к группе
+VK_ACCESS_ERROR_CODES = {15, 18, 30, 203}
+
+# Имена вида club123 / public123 / event123 и id123 — адрес стены по числовому ID
+_NUMERIC_GROUP_NAME = re.compile(r"^(?:club|public|event)(\d+)$")
+_NUMERIC_USER_NAME = re.compile(r"^id(\d+)$")
+
+
+class VKApiError(Exception):
+    """Ошибка, которую вернул VK API в поле "error"."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов (token bucket).
+    Токены пополняются со скоростью rate в секунду, но не больше capacity.
+    Один вызов acquire() забирает один токен, при их отсутствии — ждёт.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[int] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Ждущие корутины обслуживаются по очереди, в порядке прихода
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def _vk_request(
+    session: aiohttp.ClientSession,
+    limiter: TokenBucket,
+    method: str,
+    params: Dict[str, Any],
+    access_token: str,
+    retries: int = 3,
+) -> Dict[str, Any]:
+    """
+    Выполняет один метод VK API с учётом общего лимита запросов и возвращает весь JSON ответа.
+    При ошибке "Too many requests per second" повторяет запрос.
+    """
+    request_params = {"access_token": access_token, "v": VK_API_VERSION, **params}
+    for attempt in range(retries + 1):
+        await limiter.acquire()
+        async with session.post(f"{VK_API_URL}{method}", data=request_params) as resp:
+            data = await resp.json(content_type=None)
+
+        error = data.get("error")
+        if error and error.get("error_code") == VK_ERROR_TOO_MANY_REQUESTS and attempt < retries:
+            logger.warning(f"⏳ VK rate limit hit on {method}, retry {attempt + 1}/{retries}")
+            await asyncio.sleep(1 / limiter.rate * (attempt + 1))
+            continue
+        return data
+
+
+async def vk_call(
+    session: aiohttp.ClientSession,
+    limiter: TokenBucket,
+    method: str,
+    params: Dict[str, Any],
+    access_token: str,
+) -> Any:
+    """
+    Выполняет один метод VK API.
+
+    Returns:
+        Содержимое поля "response"
+    Raises:
+        VKApiError: если VK вернул ошибку
+    """
+    data = await _vk_request(session, limiter, method, params, access_token)
+    if "error" in data:
+        error = data["error"]
+        raise VKApiError(error.get("error_code"), error.get("error_msg", "Unknown VK error"))
+    return data["response"]
+
+
+def wall_address(group_name: str) -> Dict[str, Any]:
+    """
+    Адрес стены для wall.get без utils.resolveScreenName.
+    club123 / public123 / event123 и просто 123 → owner_id=-123, id123 → owner_id=123, иначе — domain.
+    Голый числовой ID считается ID группы, как и в match_groups_to_names.
+    """
+    name = group_name.lower()
+    if name.isdigit():
+        return {"owner_id": -int(name)}
+    numeric = _NUMERIC_GROUP_NAME.match(name)
+    if numeric:
+        return {"owner_id": -int(numeric.group(1))}
+    numeric = _NUMERIC_USER_NAME.match(name)
+    if numeric:
+        return {"owner_id": int(numeric.group(1))}
+    return {"domain": group_name}
+
+
+def cached_wall_address(group_name: str, cache: Optional[ScreenNameCache]) -> Dict[str, Any]:
+    """
+    Адрес стены с учётом кэша screen_name: owner_id из кэша, если имя в нём есть,
+    иначе — wall_address (числовые имена в кэше не нуждаются).
+    """
+    address = wall_address(group_name)
+    if "domain" not in address or cache is None:
+        return address
+    group_info = cache.get(group_name)
+    owner_id = owner_id_from_resolved(group_info) if group_info else None
+    return {"owner_id": owner_id} if owner_id is not None else address
+
+
+def build_wall_execute_code(group_names: List[str], count: int,
+                            addresses: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    """
+    Собирает VKScript для метода execute: один wall.get на каждую группу.
+    Группы передаются через domain (числовые ID — через owner_id, см. wall_address),
+    поэтому utils.resolveScreenName не нужен. Готовые адреса стен (например, owner_id
+    из кэша screen_name, см. cached_wall_address) можно передать через addresses.
+    """
+    addresses = addresses or {}
+    calls = ",".join(
+        f'API.wall.get({json.dumps({**(addresses.get(group) or wall_address(group)), "count": count}, ensure_ascii=False)})'
+        for group in group_names
+    )
+    return f"return [{calls}];"
+
+
+async def vk_execute_wall_get(
+    session: aiohttp.ClientSession,
+    limiter: TokenBucket,
+    group_names: List[str],
+    count: int,
+    access_token: str,
+    addresses: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> List[Tuple[Optional[dict], Optional[VKApiError]]]:
+    """
+    Читает стены нескольких групп (не больше VK_EXECUTE_BATCH_SIZE) одним запросом execute.
+
+    Args:
+        addresses: Адреса стен по группам (см. build_wall_execute_code)
+
+    Returns:
+        Список пар (ответ wall.get, ошибка) в порядке group_names.
+        Для упавших вызовов ответ равен None, а ошибка берётся из execute_errors.
+    Raises:
+        VKApiError: если упал сам запрос execute
+    """
+    if len(group_names) > VK_EXECUTE_BATCH_SIZE:
+        raise ValueError(f"execute поддерживает не больше {VK_EXECUTE_BATCH_SIZE} вызовов")
+
+    code = build_wall_execute_code(group_names, count, addresses)
+    data = await _vk_request(session, limiter, "execute", {"code": code}, access_token)
+    if "error" in data:
+        error = data["error"]
+        raise VKApiError(error.get("error_code"), error.get("error_msg", "Unknown VK error"))
+
+    responses = data.get("response") or []
+    # execute_errors содержит ошибки только упавших вызовов, в том же порядке
+    execute_errors = iter(data.get("execute_errors", []))
+    results = []
+    for i, group in enumerate(group_names):
+        wall = responses[i] if i < len(responses) else False
+        if wall:
+            results.append((wall, None))
+        else:
+            error = next(execute_errors, None)
+            if error:
+                results.append((None, VKApiError(error.get("error_code"), error.get("error_msg", "Unknown VK error"))))
+            else:
+                results.append((None, VKApiError(None, "Empty execute response")))
+    return results
+
+
+async def groups_get_by_id(
+    session: aiohttp.ClientSession,
+    limiter: TokenBucket,
+    names: List[str],
+    access_token: str,
+) -> List[dict]:
+    """
+    groups.getById для пачки имён. Если VK отвергает пачку из-за неверного имени
+    (например, screen_name пользователя), пачка делится пополам и запрашивается снова,
+    пока отвергнутые имена не останутся по одному — они отбрасываются.
+    """
+    try:
+        response = await vk_call(session, limiter, "groups.getById", {"group_ids": ",".join(names)}, access_token)
+    except VKApiError as e:
+        if e.code != VK_ERROR_INVALID_PARAM:
+            raise
+        if len(names) == 1:
+            logger.info(f"groups.getById не знает {names[0]}: {e.message}")
+            return []
+        middle = len(names) // 2
+        return (await groups_get_by_id(session, limiter, names[:middle], access_token)
+                + await groups_get_by_id(session, limiter, names[middle:], access_token))
+    # В API 5.199 ответ — {"groups": [...], "profiles": [...]}, в старых версиях — список
+    return response.get("groups", []) if isinstance(response, dict) else response
+
+
+async def warm_resolve_cache(
+    session: aiohttp.ClientSession,
+    limiter: TokenBucket,
+    group_names: List[str],
+    access_token: str,
+    cache: ScreenNameCache,
+):
+    """
+    Заполняет кэш screen_name для имён без актуальной записи через groups.getById
+    (до VK_GROUPS_GET_BY_ID_LIMIT имён за запрос). Имена, которые VK отверг или
+    не удалось сопоставить (например, пользователи), позже резолвятся по одному,
+    а в режиме execute читаются по domain.
+    """
+    missing = cache.missing(group_names)
+    if not missing:
+        return
+
+    logger.info(f"🔎 Резолвим {len(missing)} имён групп через groups.getById")
+    for i in range(0, len(missing), VK_GROUPS_GET_BY_ID_LIMIT):
+        chunk = missing[i:i + VK_GROUPS_GET_BY_ID_LIMIT]
+        try:
+            groups = await groups_get_by_id(session, limiter, chunk, access_token)
+        except (VKApiError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"⚠️ groups.getById не удался, резолвим по одному: {e}")
+            continue
+        for name, info in match_groups_to_names(chunk, groups).items():
+            cache.put(name, info)
+
+
+def take_new_items(items: List[dict], last_post_id: Optional[int]) -> Tuple[List[dict], bool]:
+    """
+    Оставляет посты новее last_post_id (wall.get отдаёт их от новых к старым).
+    Закреплённый пост может быть старым, поэтому он не останавливает разбор.
+
+    Returns:
+        tuple: (новые_посты, дошли_ли_до_уже_увиденных)
+    """
+    if last_post_id is None:
+        return items, False
+
+    new_items = []
+    for item in items:
+        if item["id"] <= last_post_id:
+            if item.get("is_pinned"):
+                continue
+            return new_items, True
+        new_items.append(item)
+    return new_items, False
+
+
+async def collect_new_wall_items(
+    session: aiohttp.ClientSession,
+    limiter: TokenBucket,
+    wall_params: Dict[str, Any],
+    first_page: List[dict],
+    count: int,
+    last_post_id: Optional[int],
+    access_token: str,
+) -> List[dict]:
+    """
+    Собирает посты новее last_post_id, начиная с уже полученной первой страницы.
+    Если вся страница новая — догружает следующие через offset (не больше VK_MAX_CATCHUP_PAGES).
+    Без отметки (первый запуск для группы) возвращает первую страницу как есть.
+
+    Args:
+        wall_params: Адрес стены для wall.get — {"owner_id": ...} или {"domain": ...}
+        first_page: Элементы первой страницы wall.get
+    """
+    items, reached_seen = take_new_items(first_page, last_post_id)
+    if last_post_id is None:
+        return items
+
+    seen_ids = {item["id"] for item in items}
+    page_size = len(first_page)
+    offset = count
+    pages = 1
+    while not reached_seen and page_size >= count and pages < VK_MAX_CATCHUP_PAGES:
+        page = await vk_call(session, limiter, "wall.get",
+                             {**wall_params, "count": count, "offset": offset}, access_token)
+        page_items = page["items"]
+        new_items, reached_seen = take_new_items(page_items, last_post_id)
+        # Пока листали, могли выйти новые посты и сдвинуть ленту — убираем повторы
+        items.extend(item for item in new_items if item["id"] not in seen_ids)
+        seen_ids.update(item["id"] for item in new_items)
+        page_size = len(page_items)
+        offset += count
+        pages += 1
+
+    if not reached_seen and pages >= VK_MAX_CATCHUP_PAGES:
+        logger.warning(f"⚠️ {wall_params}: догружено {pages} страниц, более старые новые посты пропущены")
+    return items
+
+
+def update_high_water_mark(stats: Dict[str, Any], group: str, items: List[dict]):
+    """Запоминает самый новый пост группы из этого запуска в stats["high_water_marks"]."""
+    if not items:
+        return
+    newest = max(items, key=lambda item: item["id"])
+    stats["high_water_marks"][group] = {
+        "post_id": newest["id"],
+        "post_date": datetime.utcfromtimestamp(newest["date"]).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def new_vk_stats(total_groups: int) -> Dict[str, Any]:
+    """Пустая статистика парсинга VK."""
+    return {
+        "total_groups": total_groups,
+        "processed_groups": 0,
+        "failed_groups": 0,
+        "skipped_types": {},
+        "total_posts": 0,
+        "reposts": 0,
+        "group_errors": {},  # Детальная информация об ошибках групп
+        "high_water_marks": {},  # Самые новые посты групп из этого запуска
+    }
+
+
+def owner_id_from_resolved(group_info: dict) -> Optional[int]:
+    """
+    Переводит ответ utils.resolveScreenName в owner_id для wall.get.
+    Для групп и публичных страниц ID отрицательный, для пользователей — положительный.
+    Возвращает None для неизвестного типа объекта.
+    """
+    object_type = group_info["type"]
+    object_id = group_info["object_id"]
+    if object_type == "group" or object_type == "page":
+        return -object_id
+    if object_type == "user":
+        return object_id
+    return None
+
+
+def parse_wall_items(items: List[dict], group_id: Optional[int], group_name: str, stats: Dict[str, Any]) -> List[Dict]:
+    """
+    Преобразует элементы ответа wall.get в словари постов.
+    Попутно обновляет статистику (total_posts, reposts, skipped_types).
+    Если group_id не передан, owner_id берётся из самого поста.
+    """
+    posts = []
+    for post in items:
+        stats["total_posts"] += 1
+
+        post_id = post["id"]
+        wall_owner_id = group_id if group_id is not None else post["owner_id"]
+        post_url = f"https://vk.com/wall{wall_owner_id}_{post_id}"
+
+        post_date = datetime.utcfromtimestamp(post["date"]).strftime('%Y-%m-%d %H:%M:%S')
+        is_repost = "copy_history" in post
+        if is_repost:
+            stats["reposts"] += 1
+
+        media_urls = []
+        video_urls = []
+        skipped_types = []
+        link_preview = None
+        doc_urls = []
+        gif_urls = []
+
+        for attach in post.get("attachments", []):
+            att_type = attach.get("type")
+            if att_type == "photo":
+                sizes = attach["photo"]["sizes"]
+                max_photo = max(sizes, key=lambda s: s["width"] * s["height"])
+                media_urls.append(max_photo["url"])
+            elif att_type == "video":
+                video = attach.get("video", {})
+                owner_id = video.get("owner_id")
+                video_id = video.get("id")
+                if owner_id is not None and video_id is not None:
+                    video_url = f"https://vk.com/video{owner_id}_{video_id}"
+                    video_urls.append(video_url)
+            elif att_type == "link":
+                link = attach.get("link", {})
+                url = link.get("url")
+                photo_url = None
+                photo = link.get("photo")
+                if photo:
+                    sizes = photo.get("sizes", [])
+                    if sizes:
+                        photo_url = sizes[-1].get("url")
+                link_preview = {
+                    "url": url,
+                    "photo_url": photo_url
+                }
+            elif att_type == "doc":
+                doc = attach.get("doc", {})
+                ext = doc.get("ext")
+                direct_url = doc.get("url")
+                title = doc.get("title")
+
+                if ext == "gif" and direct_url:
+                    gif_urls.append(direct_url)
+                elif direct_url:
+                    doc_urls.append({
+                        "url": direct_url,
+                        "title": title,
+                        "ext": ext
+                    })
+            else:
+                skipped_types.append(att_type)
+                stats["skipped_types"].setdefault(att_type, 0)
+                stats["skipped_types"][att_type] += 1
+
+        if skipped_types:
+            logger.info(f"📦 Post {post_url} skipped types: {', '.join(skipped_types)}")
+
+        posts.append({
+            "text": post.get("text", "") if not is_repost else "",
+            "media_urls": media_urls,
+            "gif_urls": gif_urls,
+            "video_urls": video_urls,
+            "post_url": post_url,
+            "date": post_date,
+            "group_name": group_name,
+            "is_repost": is_repost,
+            "skipped_types": skipped_types,
+            "link_preview": link_preview,
+            "doc_urls": doc_urls,
+        })
+    return posts
+
+
+def log_vk_stats(stats: Dict[str, Any]):
+    """Итоговый лог парсинга VK."""
+    logger.success(f"🎯 Обработано групп: {stats['processed_groups']}/{stats['total_groups']} | Постов: {stats['total_posts']} | Репостов: {stats['reposts']}")
+    if stats["failed_groups"]:
+        logger.warning(f"⚠️ Групп с ошибками: {stats['failed_groups']}")
+        # Выводим детали ошибок
+        for group, error in stats["group_errors"].items():
+            logger.warning(f"   • {group}: {error}")
+    if stats["skipped_types"]:
+        logger.info(f"📌 Пропущенные типы вложений: {stats['skipped_types']}")
+
+
+def record_group_error(stats: Dict[str, Any], group: str, error: str):
+    stats["failed_groups"] += 1
+    stats["group_errors"][group] = error
+
+
+def record_fetch_exception(stats: Dict[str, Any], group: str, e: Exception):
+    """Логирует исключение при загрузке группы и записывает его в stats["group_errors"]."""
+    if isinstance(e, VKApiError):
+        logger.warning(f"[Wall Error] {group}: {e.message}")
+        record_group_error(stats, group, e.message)
+    elif isinstance(e, asyncio.TimeoutError):
+        logger.error(f"⏰ Timeout error for group {group}")
+        record_group_error(stats, group, "Request timeout")
+    elif isinstance(e, aiohttp.ClientError):
+        logger.error(f"🌐 Network error for group {group}: {str(e)}")
+        record_group_error(stats, group, f"Network error: {str(e)}")
+    else:
+        logger.error(f"❌ Unexpected error for group {group}: {str(e)}")
+        record_group_error(stats, group, f"Unexpected error: {str(e)}")
+
+
+async def fetch_vk_last_posts(
+    access_token: str,
+    group_names: List[str],
+    count: int = 5,
+    save_path: Optional[str] = None,
+    requests_per_second: float = VK_REQUESTS_PER_SECOND,
+    max_concurrency: int = 10,
+    timeout: float = 10,
+    use_execute: bool = False,
+    resolve_cache: Optional[ScreenNameCache] = None,
+    high_water_marks: Optional[Dict[str, dict]] = None,
+) -> Tuple[List[Dict], Dict[str, Any]]:
+    """
+    Асинхронно получает последние посты из VK групп.
+    Группы обрабатываются параллельно (не больше max_concurrency одновременно),
+    все запросы проходят через общий token bucket на requests_per_second.
+
+    Args:
+        access_token: VK API токен
+        group_names: Список имен групп
+        count: Количество постов для получения из каждой группы
+        save_path: Путь для сохранения результатов в JSON (опционально)
+        requests_per_second: Лимит запросов к VK API в секунду
+        max_concurrency: Максимум групп (или пачек execute), обрабатываемых одновременно
+        timeout: Таймаут одного HTTP-запроса в секундах
+        use_execute: Читать стены пачками по VK_EXECUTE_BATCH_SIZE групп через метод execute
+                     (один запрос вместо двух на каждую группу)
+        resolve_cache: Постоянный кэш screen_name → owner_id (опционально). В режиме execute
+                       закэшированные группы читаются по owner_id, остальные — по domain
+        high_water_marks: Последние увиденные посты по группам {group: {"post_id", "post_date"}}.
+                          Если задано, возвращаются только более новые посты, а при большом
+                          числе новых постов следующие страницы догружаются через offset.
+                          Новые отметки кладутся в stats["high_water_marks"] — сохранять
+                          их нужно после успешной обработки постов.
+
+    Returns:
+        tuple: (все_посты, статистика) — посты идут в порядке group_names
+    """
+    stats = new_vk_stats(len(group_names))
+    high_water_marks = high_water_marks or {}
+    limiter = TokenBucket(requests_per_second)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch_group(session: aiohttp.ClientSession, group: str) -> List[Dict]:
+        async with semaphore:
+            try:
+                group_info = resolve_cache.get(group) if resolve_cache else None
+                if group_info is None:
+                    # Получаем информацию о группе через utils.resolveScreenName
+                    group_info = await vk_call(session, limiter, "utils.resolveScreenName",
+                                               {"screen_name": group}, access_token)
+                    if not group_info:
+                        raise VKApiError(None, "Group not found")
+                    if resolve_cache:
+                        resolve_cache.put(group, group_info)
+
+                object_type = group_info["type"]
+                if object_type == "group":
+                    logger.info(f"👥 Fetching group data: {group}")
+                elif object_type == "page":
+                    logger.info(f"📄 Fetching page data: {group}")
+                elif object_type == "user":
+                    logger.info(f"👤 Fetching user data: {group}")
+
+                group_id = owner_id_from_resolved(group_info)
+                if group_id is None:
+                    logger.warning(f"[Group Error] {group}: Unknown object type: {object_type}")
+                    record_group_error(stats, group, f"Unknown object type: {object_type}")
+                    return []
+
+                try:
+                    wall = await vk_call(session, limiter, "wall.get",
+                                         {"owner_id": group_id, "count": count}, access_token)
+                except VKApiError as e:
+                    if resolve_cache and e.code in VK_ACCESS_ERROR_CODES:
+                        resolve_cache.invalidate(group)
+                    raise
+                items = await collect_new_wall_items(
+                    session, limiter, {"owner_id": group_id}, wall["items"], count,
+                    high_water_marks.get(group, {}).get("post_id"), access_token
+                )
+                stats["processed_groups"] += 1
+                update_high_water_mark(stats, group, items)
+                return parse_wall_items(items, group_id, group, stats)
+
+            except Exception as e:
+                record_fetch_exception(stats, group, e)
+            return []
+
+    async def fetch_batch(session: aiohttp.ClientSession, batch: List[str]) -> List[List[Dict]]:
+        async with semaphore:
+            logger.info(f"📦 Fetching {len(batch)} groups via execute")
+            # Имена из кэша screen_name читаем по owner_id, остальные — по domain
+            addresses = {group: cached_wall_address(group, resolve_cache) for group in batch}
+            try:
+                walls = await vk_execute_wall_get(session, limiter, batch, count, access_token, addresses)
+            except Exception as e:
+                # Упал весь запрос — ошибка относится к каждой группе пачки
+                for group in batch:
+                    record_fetch_exception(stats, group, e)
+                return [[] for _ in batch]
+
+            per_group = []
+            for group, (wall, error) in zip(batch, walls):
+                if error is not None:
+                    if resolve_cache and error.code in VK_ACCESS_ERROR_CODES:
+                        resolve_cache.invalidate(group)
+                    record_fetch_exception(stats, group, error)
+                    per_group.append([])
+                    continue
+                try:
+                    items = await collect_new_wall_items(
+                        session, limiter, addresses[group], wall["items"], count,
+                        high_water_marks.get(group, {}).get("post_id"), access_token
+                    )
+                except Exception as e:
+                    if resolve_cache and isinstance(e, VKApiError) and e.code in VK_ACCESS_ERROR_CODES:
+                        resolve_cache.invalidate(group)
+                    record_fetch_exception(stats, group, e)
+                    per_group.append([])
+                    continue
+                stats["processed_groups"] += 1
+                update_high_water_mark(stats, group, items)
+                # Для имён, прочитанных по domain, owner_id берём из самих постов
+                per_group.append(parse_wall_items(items, addresses[group].get("owner_id"), group, stats))
+            return per_group
+
+    connector = aiohttp.TCPConnector(limit=max_concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        if use_execute:
+            if resolve_cache:
+                # Числовые имена адресуются и без кэша — резолвим только screen_name
+                screen_names = [group for group in group_names if "domain" in wall_address(group)]
+                await warm_resolve_cache(session, limiter, screen_names, access_token, resolve_cache)
+            batches = [group_names[i:i + VK_EXECUTE_BATCH_SIZE]
+                       for i in range(0, len(group_names), VK_EXECUTE_BATCH_SIZE)]
+            per_batch = await asyncio.gather(*(fetch_batch(session, batch) for batch in batches))
+            per_group = [group_posts for batch_posts in per_batch for group_posts in batch_posts]
+        else:
+            if resolve_cache:
+                await warm_resolve_cache(session, limiter, group_names, access_token, resolve_cache)
+            per_group = await asyncio.gather(*(fetch_group(session, group) for group in group_names))
+
+    if resolve_cache:
+        logger.info(f"🗂 Кэш screen_name: {resolve_cache.hits} попаданий, {resolve_cache.misses} промахов")
+        resolve_cache.save()
+
+    all_posts = [post for group_posts in per_group for post in group_posts]
+
+    log_vk_stats(stats)
+
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(all_posts, f, ensure_ascii=False, indent=4)
+        logger.info(f"💾 Посты сохранены в {save_path}")
+
+    return all_posts, stats
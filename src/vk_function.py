@@ -1,10 +1,9 @@
 import re
 import json
-import pandas as pd
 import requests
 import os
-from yt_dlp import YoutubeDL
 from loguru import logger
+from src.startup_timing import timed_import
 from typing import Optional, Union, Dict, List
 from config import credentials
 
@@ -199,6 +198,7 @@ def get_last_posts(
 
     items = posts["response"]["items"]
     result = []
+    pd = timed_import("pandas")
 
     for post in items:
         attachments = post.get("attachments", [])
@@ -366,6 +366,7 @@ def get_vk_video_info(video_url) -> Optional[Dict]:
         'quiet': True,
         'skip_download': True,
     }
+    YoutubeDL = timed_import("yt_dlp").YoutubeDL
     with YoutubeDL(ydl_opts) as ydl:
         try:
             video_info = ydl.extract_info(video_url, download=False)
@@ -383,6 +384,7 @@ def download_vk_video(video_url, output_path='./videos/'):
         'quiet': True,
     }
 
+    YoutubeDL = timed_import("yt_dlp").YoutubeDL
     with YoutubeDL(ydl_opts) as ydl:
         try:
             info_dict = ydl.extract_info(video_url, download=True)
@@ -0,0 +1,109 @@
+"""
+Постоянный кэш соответствия screen_name → объект VK (type + object_id).
+Хранится в локальном JSON-файле, чтобы не вызывать utils.resolveScreenName
+для каждой группы при каждом запуске.
+"""
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+# Время жизни записи: соответствие имени и ID меняется крайне редко
+DEFAULT_RESOLVE_TTL = 7 * 24 * 3600
+
+# Имена вида club123 / public123 / event123 — однозначно указывают на ID группы
+_NUMERIC_GROUP_NAME = re.compile(r"^(?:club|public|event)(\d+)$")
+
+
+class ScreenNameCache:
+    """
+    Кэш результатов utils.resolveScreenName с TTL.
+    Формат записи совпадает с ответом VK: {"type": ..., "object_id": ...},
+    плюс служебное поле resolved_at (unix time).
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_RESOLVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._entries: Dict[str, dict] = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+                logger.info(f"🗂 Загружено {len(self._entries)} записей кэша screen_name из {path}")
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"⚠️ Не удалось прочитать кэш screen_name {path}: {e}")
+
+    def get(self, name: str) -> Optional[dict]:
+        entry = self._entries.get(name.lower())
+        if entry and time.time() - entry.get("resolved_at", 0) < self.ttl:
+            self.hits += 1
+            return {"type": entry["type"], "object_id": entry["object_id"]}
+        self.misses += 1
+        return None
+
+    def put(self, name: str, info: dict):
+        self._entries[name.lower()] = {
+            "type": info["type"],
+            "object_id": info["object_id"],
+            "resolved_at": time.time(),
+        }
+        self._dirty = True
+
+    def invalidate(self, name: str):
+        if self._entries.pop(name.lower(), None) is not None:
+            logger.info(f"🧹 Запись кэша screen_name для {name} сброшена")
+            self._dirty = True
+
+    def missing(self, names: List[str]) -> List[str]:
+        """Имена, для которых нет актуальной записи (не учитывается в hits/misses)."""
+        now = time.time()
+        return [
+            name for name in names
+            if now - self._entries.get(name.lower(), {}).get("resolved_at", 0) >= self.ttl
+        ]
+
+    def save(self):
+        if not self._dirty:
+            return
+        # Пишем во временный файл и атомарно подменяем, чтобы не оставить битый JSON
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+def match_groups_to_names(names: List[str], groups: List[dict]) -> Dict[str, dict]:
+    """
+    Сопоставляет ответ groups.getById с запрошенными именами.
+    Имя совпадает с группой по screen_name, по виду club123/public123 или по числовому ID.
+
+    Returns:
+        {имя: {"type": ..., "object_id": ...}} только для найденных групп
+    """
+    by_screen_name = {g.get("screen_name", "").lower(): g for g in groups}
+    by_id = {g["id"]: g for g in groups}
+
+    resolved = {}
+    for name in names:
+        group = by_screen_name.get(name.lower())
+        if group is None:
+            numeric = _NUMERIC_GROUP_NAME.match(name.lower())
+            if numeric:
+                group = by_id.get(int(numeric.group(1)))
+            elif name.isdigit():
+                group = by_id.get(int(name))
+        if group is None:
+            continue
+        # Для wall.get "event" ведёт себя как обычная группа
+        object_type = "page" if group.get("type") == "page" else "group"
+        resolved[name] = {"type": object_type, "object_id": group["id"]}
+    return resolved
@@ -3,9 +3,8 @@ import re
 import time
 from pprint import pprint
 from typing import Optional
-from yt_dlp import YoutubeDL
 from loguru import logger
-from moviepy import VideoFileClip
+from src.startup_timing import timed_import
 
 
 def download_vk_video(video_url, output_path='./videos/'):
@@ -17,6 +16,8 @@ def download_vk_video(video_url, output_path='./videos/'):
         # 'proxy': 'socks5h://[::1]:2080',
     }
 
+    # yt_dlp импортируется при первом скачивании, а не при старте
+    YoutubeDL = timed_import("yt_dlp").YoutubeDL
     with YoutubeDL(ydl_opts) as ydl:
         try:
             info_dict = ydl.extract_info(video_url, download=True)
@@ -61,6 +62,7 @@ def get_vk_video_info(video_url, retries=2, delay=3):
         # 'proxy': 'socks5h://[::1]:2080',
     }
 
+    YoutubeDL = timed_import("yt_dlp").YoutubeDL
     for attempt in range(retries + 1):
         try:
             with YoutubeDL(ydl_opts) as ydl:
@@ -0,0 +1,26 @@
+import os
+
+import numpy as np
+
+from src.text_processing.embedding_cache import EmbeddingCache
+
+
+def vectors(start, count, dim=4):
+    return np.array([[float(i)] * dim for i in range(start, start + count)], dtype=np.float32)
+
+
+def test_disk_tier_is_compacted_to_newest_records(tmp_path):
+    dim = 4
+    record_size = dim * 4 + 65
+    cache = EmbeddingCache("model", dim, cache_dir=str(tmp_path), max_disk_bytes=10 * record_size)
+    for start in range(0, 12, 3):
+        texts = [f"text {i}" for i in range(start, start + 3)]
+        cache.put_many(texts, vectors(start, 3, dim))
+
+    total = sum(os.path.getsize(path) for path in tmp_path.iterdir())
+    assert total <= 10 * record_size
+
+    reloaded = EmbeddingCache("model", dim, cache_dir=str(tmp_path), max_disk_bytes=10 * record_size)
+    found, missing = reloaded.get_many([f"text {i}" for i in range(12)])
+    assert missing == list(range(7))
+    assert {i: vector[0] for i, vector in found.items()} == {i: float(i) for i in range(7, 12)}
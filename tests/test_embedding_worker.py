@@ -0,0 +1,53 @@
+import asyncio
+
+import numpy as np
+
+from src.text_processing.embedding_worker import EmbeddingWorker
+
+
+class RecordingWorker(EmbeddingWorker):
+    """Вместо модели в процессе кодирует текст его номером и запоминает части батчей."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.shards = []
+
+    async def _encode_shard(self, texts):
+        self.shards.append(list(texts))
+        await asyncio.sleep(0.01)
+        return np.array([[float(text)] for text in texts], dtype=np.float32)
+
+
+def run_worker(worker: EmbeddingWorker, requests):
+    async def run():
+        try:
+            return await asyncio.gather(*(worker.encode(texts) for texts in requests))
+        finally:
+            worker.close()
+    return asyncio.run(run())
+
+
+def test_large_request_is_split_across_workers():
+    worker = RecordingWorker(workers=4, batch_size=8, max_shard_size=64)
+    texts = [str(i) for i in range(100)]
+    [result] = run_worker(worker, [texts])
+
+    assert [len(shard) for shard in worker.shards] == [25, 25, 25, 25]
+    assert result.ravel().tolist() == list(range(100))
+
+
+def test_close_fails_pending_requests():
+    worker = EmbeddingWorker(workers=1, batch_size=8)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        stuck = loop.create_future()
+        worker._encode_shard = lambda texts: worker._track(stuck)
+        request = asyncio.ensure_future(worker.encode(["1"]))
+        while not worker._pending:
+            await asyncio.sleep(0)
+        worker.close()
+        return await asyncio.gather(request, return_exceptions=True)
+
+    [error] = asyncio.run(run())
+    assert isinstance(error, RuntimeError)
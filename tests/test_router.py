@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from src.text_processing.ai import limits, router
+from src.text_processing.ai.limits import ProviderLimiter
+from src.text_processing.ai.router import RewriteRouter
+
+
+def make_provider(name: str, latency: float, calls: list):
+    async def rewrite(text: str) -> str:
+        calls.append(name)
+        await asyncio.sleep(latency)
+        return f"{name}: {text}"
+    return rewrite
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    # Быстрые лимитеры без ограничения в минуту: очередь задаёт только семафор
+    monkeypatch.setattr(limits, "_limiters", {
+        "first": ProviderLimiter("first", max_concurrency=2, requests_per_minute=60000),
+        "second": ProviderLimiter("second", max_concurrency=2, requests_per_minute=60000),
+    })
+    monkeypatch.setattr(router, "AI_HEDGE_DEFAULT_DEADLINE", 0.1)
+    monkeypatch.setattr(router, "AI_HEDGE_MIN_DEADLINE", 0.1)
+    calls = []
+    return calls, {
+        "first": make_provider("first", 0.06, calls),
+        "second": make_provider("second", 0.06, calls),
+    }
+
+
+def test_limiter_queue_does_not_trigger_hedge(providers):
+    calls, funcs = providers
+    rewrite_router = RewriteRouter(funcs)
+
+    async def run():
+        return await asyncio.gather(*(rewrite_router(f"text {i}") for i in range(10)))
+
+    results = asyncio.run(run())
+    assert all(result for result in results)
+    assert sum(stats.hedges for stats in rewrite_router.stats.values()) == 0
+    assert len(calls) == 10
+
+
+def test_slow_provider_is_hedged(providers, monkeypatch):
+    calls, funcs = providers
+    funcs["first"] = make_provider("first", 1.0, calls)
+    rewrite_router = RewriteRouter(funcs)
+
+    result = asyncio.run(rewrite_router("text"))
+    assert result == "second: text"
+    assert rewrite_router.stats["second"].hedges == 1
+
+
+def test_rewrite_reports_winning_provider(providers):
+    calls, funcs = providers
+    funcs["first"] = make_provider("first", 1.0, calls)
+    rewrite_router = RewriteRouter(funcs)
+
+    assert asyncio.run(rewrite_router.rewrite("text")) == ("second: text", "second")
@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+from src import vk_fetcher
+from src.vk_fetcher import (
+    VK_ERROR_INVALID_PARAM, VKApiError, build_wall_execute_code, cached_wall_address, wall_address,
+    warm_resolve_cache,
+)
+from src.vk_resolve_cache import ScreenNameCache
+
+
+def execute_calls(code: str) -> list:
+    calls = code[len("return ["):-len("];")].split("API.wall.get(")[1:]
+    return [json.loads(call.rstrip(",)")) for call in calls]
+
+
+def test_wall_address_numeric_forms():
+    assert wall_address("club123") == {"owner_id": -123}
+    assert wall_address("public456") == {"owner_id": -456}
+    assert wall_address("event7") == {"owner_id": -7}
+    assert wall_address("id89") == {"owner_id": 89}
+    assert wall_address("Public10") == {"owner_id": -10}
+    assert wall_address("12345") == {"owner_id": -12345}
+
+
+def test_wall_address_screen_name():
+    assert wall_address("lentaru") == {"domain": "lentaru"}
+    assert wall_address("club_news") == {"domain": "club_news"}
+    assert wall_address("idea42x") == {"domain": "idea42x"}
+
+
+def test_execute_code_uses_owner_id_for_numeric_groups():
+    code = build_wall_execute_code(["lentaru", "club123", "public456", "id89", "12345"], 5)
+    assert execute_calls(code) == [
+        {"domain": "lentaru", "count": 5},
+        {"owner_id": -123, "count": 5},
+        {"owner_id": -456, "count": 5},
+        {"owner_id": 89, "count": 5},
+        {"owner_id": -12345, "count": 5},
+    ]
+
+
+def test_execute_code_uses_cached_owner_ids(tmp_path):
+    cache = ScreenNameCache(str(tmp_path / "cache.json"))
+    cache.put("lentaru", {"type": "page", "object_id": 42})
+    groups = ["lentaru", "unknown", "club123"]
+    addresses = {group: cached_wall_address(group, cache) for group in groups}
+    assert execute_calls(build_wall_execute_code(groups, 5, addresses)) == [
+        {"owner_id": -42, "count": 5},
+        {"domain": "unknown", "count": 5},
+        {"owner_id": -123, "count": 5},
+    ]
+
+
+def test_warm_resolve_cache_drops_rejected_names(tmp_path, monkeypatch):
+    known = {"lentaru": 1, "meduzaproject": 2, "rbc": 3}
+    requests = []
+
+    async def fake_vk_call(session, limiter, method, params, access_token):
+        names = params["group_ids"].split(",")
+        requests.append(names)
+        if any(name not in known for name in names):
+            raise VKApiError(VK_ERROR_INVALID_PARAM, "Invalid group id")
+        return {"groups": [{"id": known[name], "screen_name": name, "type": "page"} for name in names]}
+
+    monkeypatch.setattr(vk_fetcher, "vk_call", fake_vk_call)
+    cache = ScreenNameCache(str(tmp_path / "cache.json"))
+    asyncio.run(warm_resolve_cache(None, None, ["lentaru", "durov", "meduzaproject", "rbc"], "token", cache))
+
+    assert {name: cache.get(name) for name in known} == {
+        name: {"type": "page", "object_id": object_id} for name, object_id in known.items()
+    }
+    assert cache.get("durov") is None
+    # Пачка делится пополам: отвергнутое имя запрошено отдельно, остальные — пачками
+    assert requests == [
+        ["lentaru", "durov", "meduzaproject", "rbc"],
+        ["lentaru", "durov"], ["lentaru"], ["durov"],
+        ["meduzaproject", "rbc"],
+    ]